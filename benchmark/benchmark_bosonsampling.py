@@ -29,6 +29,8 @@
 
 import math
 
+import pytest
+
 import perceval as pcvl
 from perceval.components.unitary_components import BS, PS, Unitary
 
@@ -55,3 +57,19 @@ def test_bosonsampling_clifford_6(benchmark):
 def test_bosonsampling_clifford_8(benchmark):
     benchmark(simulate_sampling, shots=20,
               circuit=get_interferometer(8), input_state=pcvl.BasicState([1] * 8))
+
+
+def simulate_parallel_sampling(count, n_processes, seed, circuit, input_state):
+    clifford = pcvl.Clifford2017Backend()
+    clifford.set_circuit(circuit)
+    clifford.set_input_state(input_state)
+    clifford.samples(count, n_processes=n_processes, seed=seed)
+
+
+# n_processes=None is the native single stream baseline, seeded runs use the reproducible numpy streams
+@pytest.mark.parametrize("n_processes, seed", [(None, None), (2, None), (4, None), (8, None), (1, 0), (4, 0)])
+def test_bosonsampling_clifford_10_parallel(benchmark, n_processes, seed):
+    benchmark.pedantic(simulate_parallel_sampling, kwargs=dict(count=2000, n_processes=n_processes, seed=seed,
+                                                               circuit=get_interferometer(10),
+                                                               input_state=pcvl.BasicState([1] * 10)),
+                       rounds=1, iterations=1)
@@ -0,0 +1,70 @@
+# MIT License
+#
+# Copyright (c) 2022 Quandela
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# As a special exception, the copyright holders of exqalibur library give you
+# permission to combine exqalibur with code included in the standard release of
+# Perceval under the MIT license (or modified versions of such code). You may
+# copy and distribute such a combined system following the terms of the MIT
+# license for both exqalibur and Perceval. This exception for the usage of
+# exqalibur is limited to the python bindings used by Perceval.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+import pytest
+
+import perceval as pcvl
+from perceval.backends import SLOSBackend
+from perceval.components import Unitary
+
+M = 12
+INPUT_STATE = pcvl.BasicState([1] * 6 + [0] * 6)
+CIRCUIT = Unitary(pcvl.Matrix.random_unitary(M))
+
+
+def run_slos(circuit, input_state, dtype, low_memory=False):
+    slos = SLOSBackend(dtype=dtype, low_memory=low_memory)
+    slos.set_circuit(circuit)
+    return slos.all_prob(input_state)
+
+
+def slos_peak_memory(circuit, input_state, dtype, low_memory):
+    slos = SLOSBackend(dtype=dtype, low_memory=low_memory)
+    slos.set_circuit(circuit)
+    slos.set_input_state(input_state)
+    return slos.peak_memory
+
+
+@pytest.mark.parametrize("low_memory", [False, True])
+@pytest.mark.parametrize("dtype", [np.complex128, np.complex64])
+def test_slos_all_prob(benchmark, dtype, low_memory):
+    benchmark(run_slos, circuit=CIRCUIT, input_state=INPUT_STATE, dtype=dtype, low_memory=low_memory)
+    # Coefficient vectors and Fock space maps
+    benchmark.extra_info["peak_memory"] = slos_peak_memory(CIRCUIT, INPUT_STATE, dtype, low_memory)
+
+
+def test_slos_complex64_error(benchmark):
+    reference = run_slos(CIRCUIT, INPUT_STATE, np.complex128)
+    probs = benchmark(run_slos, circuit=CIRCUIT, input_state=INPUT_STATE, dtype=np.complex64)
+    max_error = float(np.max(np.abs(probs - reference)))
+    tvd = float(np.abs(probs - reference).sum()) / 2
+    benchmark.extra_info["max_abs_error"] = max_error
+    benchmark.extra_info["total_variation_distance"] = tvd
+    assert max_error < 1e-5
@@ -26,13 +26,17 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import os
 import warnings
+from typing import Dict, List
 
 from ._abstract_backends import ABackend, ASamplingBackend, AProbAmpliBackend
 from ._clifford2017 import Clifford2017Backend
+from ._fsm_cache import FSMapCache
 from ._naive import NaiveBackend
-from ._slos import SLOSBackend
+from ._slos import SLOSBackend, fock_space_map_table
 from ._mps import MPSBackend
+from ._sampling_adapter import SamplingAdapter
 
 
 BACKEND_LIST = {
@@ -44,9 +48,28 @@ BACKEND_LIST = {
 
 
 class BackendFactory:
+    AUTO_CANDIDATES = ["SLOS", "Naive"]  # Exact probability amplitude backends the "auto" backend chooses from
+
     @staticmethod
     def get_backend(backend_name: str = "SLOS", **kwargs) -> ABackend:
+        """Instantiate a backend from its name
+
+        :param backend_name: a name from `BackendFactory.list()`, or "auto". The "auto" backend is the fastest exact
+            backend fitting in the available memory, according to `BackendFactory.estimate`. It requires `circuit` and
+            `input_state` keyword arguments (and optionally `outputs`), and defaults to SLOS otherwise (with a warning).
+            A Processor created with the "auto" backend makes this choice once its input state is set.
+        :param kwargs: parameters passed to the backend constructor
+        """
         name = backend_name
+        if name == "auto":
+            circuit = kwargs.pop("circuit", None)
+            input_state = kwargs.pop("input_state", None)
+            outputs = kwargs.pop("outputs", None)
+            name = "SLOS"
+            if circuit is not None and input_state is not None:
+                name = BackendFactory.choose(circuit, input_state, outputs)
+            else:
+                warnings.warn('The "auto" backend requires a circuit and an input state. Falling back on SLOS')
         if name in BACKEND_LIST:
             return BACKEND_LIST[name](**kwargs)
         warnings.warn(f'Backend "{name}" not found. Falling back on SLOS')
@@ -55,3 +78,45 @@ class BackendFactory:
     @staticmethod
     def list():
         return list(BACKEND_LIST.keys())
+
+    @staticmethod
+    def estimate(circuit, input_state, outputs: List = None) -> Dict[str, Dict[str, float]]:
+        """Predict the resources each registered backend needs to compute output probabilities
+
+        Predictions come from each backend's cost model and are rough, order-of-magnitude figures.
+
+        :param circuit: the circuit to simulate
+        :param input_state: the input state
+        :param outputs: (Optional) the output states whose probability is needed. Default is the whole output
+            distribution.
+        :return: a dictionary giving, for each backend name, the predicted computation "time" (in seconds) and
+            "memory" (in bytes). Backends unable to estimate (or perform) the computation are not listed.
+        """
+        output_count = None if outputs is None else len(outputs)
+        estimates = {}
+        for name, backend_type in BACKEND_LIST.items():
+            estimate = backend_type.estimate_cost(circuit, input_state, output_count)
+            if estimate is not None:
+                estimates[name] = estimate
+        return estimates
+
+    @staticmethod
+    def choose(circuit, input_state, outputs: List = None) -> str:
+        """Name of the fastest exact backend fitting in the available memory (the most memory efficient one, if none
+        fits) to compute output probabilities, according to `BackendFactory.estimate`"""
+        estimates = BackendFactory.estimate(circuit, input_state, outputs)
+        candidates = {name: est for name, est in estimates.items() if name in BackendFactory.AUTO_CANDIDATES}
+        available_memory = _available_memory()
+        fitting = {name: est for name, est in candidates.items()
+                   if available_memory is None or est["memory"] <= available_memory}
+        if fitting:
+            return min(fitting, key=lambda name: fitting[name]["time"])
+        return min(candidates, key=lambda name: candidates[name]["memory"])
+
+
+def _available_memory():
+    """Available physical memory in bytes, or None when it cannot be retrieved on this platform"""
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
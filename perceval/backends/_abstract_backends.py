@@ -28,9 +28,15 @@
 # SOFTWARE.
 
 from abc import ABC, abstractmethod
+import itertools
+import math
+from typing import Dict, List, Optional
+
+import exqalibur as xq
+import numpy as np
 
 from perceval.components import ACircuit
-from perceval.utils import BasicState, BSDistribution, allstate_iterator, StateVector
+from perceval.utils import BasicState, BSDistribution, allstate_iterator, StateVector, global_params
 
 
 class ABackend(ABC):
@@ -45,6 +51,11 @@ class ABackend(ABC):
         self._circuit = circuit
         self._umat = circuit.compute_unitary()
 
+    @property
+    def unitary(self):
+        """Unitary matrix of the current circuit"""
+        return self._umat
+
     def set_input_state(self, input_state: BasicState):
         self._check_state(input_state)
         self._input_state = input_state
@@ -58,8 +69,28 @@ class ABackend(ABC):
     def name(self) -> str:
         """Each backend has to expose its name as a string"""
 
+    @classmethod
+    def estimate_cost(cls, circuit: ACircuit, input_state: BasicState,
+                      output_count: int = None) -> Optional[Dict[str, float]]:
+        """Rough prediction of the resources needed to compute the output probabilities of a given input state
+
+        :param circuit: the circuit to simulate
+        :param input_state: the input state
+        :param output_count: number of output states whose probability is needed. None stands for the whole output
+            distribution.
+        :return: a dictionary with the predicted computation "time" (in seconds) and "memory" (in bytes), or None if
+            the backend cannot estimate (or perform) this computation
+        """
+        return None
+
+    @staticmethod
+    def _output_space_size(input_state: BasicState) -> int:
+        return math.comb(input_state.n + input_state.m - 1, input_state.n)
+
 
 class ASamplingBackend(ABackend):
+    ACCEPTS_ANNOTATED_STATES = False  # True if the backend samples input states with distinguishable photons
+
     @abstractmethod
     def sample(self):
         """Request one sample from the circuit given an input state"""
@@ -74,6 +105,14 @@ class AProbAmpliBackend(ABackend):
     def prob_amplitude(self, output_state: BasicState) -> complex:
         pass
 
+    def prob_amplitudes(self, output_states: List[BasicState]) -> np.ndarray:
+        """Probability amplitudes of several output states at once
+
+        :param output_states: the output states
+        :return: an array of complex amplitudes, in the order of `output_states`
+        """
+        return np.array([self.prob_amplitude(output_state) for output_state in output_states], dtype=complex)
+
     def probability(self, output_state: BasicState) -> float:
         return abs(self.prob_amplitude(output_state)) ** 2
 
@@ -83,6 +122,105 @@ class AProbAmpliBackend(ABackend):
             bsd.add(output_state, self.probability(output_state))
         return bsd
 
+    def marginal_distribution(self, modes: List[int]) -> BSDistribution:
+        """Photon count distribution on a subset of the output modes, all other modes being traced out
+
+        The distribution is computed from the generating function G(z) = sum_k P(k) z^k, which is the permanent of
+        (U^dagger D(z) U) restricted to the input photons, with D(z) being the identity with z on the kept modes.
+        Evaluating G on the (n+1)-th roots of unity and applying a discrete Fourier transform gives all the
+        marginal probabilities, without enumerating the output Fock space.
+
+        This relies on the exact circuit unitary: backends whose output distribution is restricted or approximated
+        (e.g. by a mask or a truncation) trace out their own distribution instead (see `_traced_out_distribution`).
+
+        :param modes: the output modes to keep
+        :return: the distribution of the photon counts in the kept modes, as states of len(modes) modes
+        """
+        input_state = self._input_state
+        m = input_state.m
+        n = input_state.n
+        modes = self._check_modes(modes)
+        s = len(modes)
+        grid_size = n + 1
+        if n == 0 or s == 0:
+            return BSDistribution(BasicState([0] * s))
+        if grid_size ** s > math.comb(n + m - 1, n):
+            # The output space is smaller than the evaluation grid, tracing out the full distribution is cheaper
+            return self._traced_out_distribution(modes)
+
+        photon_modes = [mode for mode in range(m) for _ in range(input_state[mode])]
+        v = np.asarray(self._umat, dtype=complex)[:, photon_modes]
+        v_kept = v[modes, :]
+        gram = v.conj().T @ v
+        roots = np.exp(2j * math.pi * np.arange(grid_size) / grid_size)
+        gen = np.empty((grid_size,) * s, dtype=complex)
+        for exponents in itertools.product(range(grid_size), repeat=s):
+            z = roots[list(exponents)]
+            gen[exponents] = xq.permanent_cx(gram + (v_kept.conj().T * (z - 1)) @ v_kept, n_threads=1)
+        probs = np.fft.fftn(gen).real / (grid_size ** s * input_state.prodnfact())
+
+        bsd = BSDistribution()
+        for counts in itertools.product(range(grid_size), repeat=s):
+            if sum(counts) <= n and probs[counts] > global_params['min_p']:
+                bsd.add(BasicState(list(counts)), float(probs[counts]))
+        return bsd
+
+    def _check_modes(self, modes: List[int]) -> List[int]:
+        modes = list(modes)
+        assert len(set(modes)) == len(modes) and all(0 <= mode < self._input_state.m for mode in modes), \
+            f"Invalid modes {modes}"
+        return modes
+
+    def _traced_out_distribution(self, modes: List[int]) -> BSDistribution:
+        """Photon count distribution on a subset of the output modes, traced out from `prob_distribution`"""
+        bsd = BSDistribution()
+        for state, prob in self.prob_distribution().items():
+            bsd.add(BasicState([state[mode] for mode in modes]), prob)
+        return bsd
+
+    def _collapsed_click_patterns(self) -> BSDistribution:
+        """Click pattern distribution of threshold detectors, collapsed from `prob_distribution`"""
+        bsd = BSDistribution()
+        for state, prob in self.prob_distribution().items():
+            bsd.add(BasicState([min(count, 1) for count in state]), prob)
+        return bsd
+
+    def threshold_prob_distribution(self) -> BSDistribution:
+        """Click pattern distribution of threshold detectors, i.e. the probability of each set of modes receiving at
+        least one photon, returned as states containing only 0 and 1
+
+        The probability Q(T) that all photons end in a set of modes T is the permanent of (U_T^dagger U_T) restricted
+        to the input photons, U_T being the rows of the unitary matrix corresponding to T. A Moebius inversion over
+        the subsets of at most n modes then gives the click pattern probabilities, without any computation in the
+        bunched output Fock space. As for `marginal_distribution`, this relies on the exact circuit unitary.
+        """
+        input_state = self._input_state
+        m = input_state.m
+        n = input_state.n
+        if n == 0:
+            return BSDistribution(BasicState([0] * m))
+        photon_modes = [mode for mode in range(m) for _ in range(input_state[mode])]
+        v = np.asarray(self._umat, dtype=complex)[:, photon_modes]
+        prodnfact = input_state.prodnfact()
+        probs = {}  # Probabilities indexed by click pattern bit masks
+        for size in range(1, min(n, m) + 1):
+            for modes in itertools.combinations(range(m), size):
+                v_t = v[list(modes), :]
+                probs[sum(1 << mode for mode in modes)] = \
+                    xq.permanent_cx(v_t.conj().T @ v_t, n_threads=1).real / prodnfact
+        # Moebius inversion: turn "all photons in T" probabilities into "clicks exactly in T" probabilities
+        for mode in range(m):
+            bit = 1 << mode
+            for pattern in probs:
+                if pattern & bit:
+                    probs[pattern] -= probs.get(pattern ^ bit, 0)
+
+        bsd = BSDistribution()
+        for pattern, prob in probs.items():
+            if prob > global_params['min_p']:
+                bsd.add(BasicState([(pattern >> mode) & 1 for mode in range(m)]), prob)
+        return bsd
+
     def evolve(self) -> StateVector:
         res = StateVector()
         for output_state in allstate_iterator(self._input_state):
@@ -27,29 +27,179 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
 import exqalibur as xq
-from perceval.utils import BasicState
+import numpy as np
+
+from perceval.utils import BasicState, BSSamples
 from perceval.components import ACircuit
 from ._abstract_backends import ASamplingBackend
 
 
+def _sample_stream(groups: List[np.ndarray], count: int, seed_sequence: np.random.SeedSequence) -> np.ndarray:
+    """Clifford & Clifford (2017) algorithm B, drawing samples from a numpy random stream.
+
+    Output modes are drawn one photon at a time: with k photons already placed in the output modes r, the next one is
+    placed in mode i with a probability proportional to the squared modulus of the permanent of the rows (r, i) of the
+    first k+1 (randomly permuted) input photon columns, expanded along row i.
+
+    :param groups: for each group of indistinguishable photons, the (m, n) matrix made of the unitary columns of each
+        of its photons. Groups are sampled independently, and their output occupations summed.
+    :param count: number of samples
+    :param seed_sequence: seed of the random stream
+    :return: (count, m) array of output occupations
+    """
+    rng = np.random.default_rng(seed_sequence)
+    m = groups[0].shape[0]
+    result = np.zeros((count, m), dtype=int)
+    for sample in range(count):
+        for u_in in groups:
+            a = u_in[:, rng.permutation(u_in.shape[1])]
+            rows = []
+            for k in range(u_in.shape[1]):
+                if k == 0:
+                    amplitudes = a[:, 0]
+                else:
+                    sub_matrix = a[rows, :k + 1]
+                    minors = np.array([xq.permanent_cx(np.ascontiguousarray(np.delete(sub_matrix, col, axis=1)), 1)
+                                       for col in range(k + 1)])
+                    amplitudes = a[:, :k + 1] @ minors
+                weights = np.cumsum(np.abs(amplitudes) ** 2)
+                rows.append(min(int(np.searchsorted(weights, rng.random() * weights[-1], side='right')), m - 1))
+            np.add.at(result[sample], rows, 1)
+    return result
+
+
+def _sample_native(umat: np.ndarray, groups: List[List[int]], count: int) -> np.ndarray:
+    """Samples drawn by native exqalibur samplers, one per group of indistinguishable photons (see `_sample_stream`)
+
+    :param umat: the circuit unitary matrix
+    :param groups: the mode occupations of each group of indistinguishable photons
+    :param count: number of samples
+    :return: (count, m) array of output occupations
+    """
+    result = np.zeros((count, umat.shape[0]), dtype=int)
+    for group in groups:
+        sampler = xq.Clifford2017()
+        sampler.set_unitary(umat)
+        sampler.set_input_state(BasicState(group))
+        result += np.array([list(state) for state in sampler.samples(count)], dtype=int).reshape(count, -1)
+    return result
+
+
 class Clifford2017Backend(ASamplingBackend):
+    """Sampling backend implementing the Clifford & Clifford (2017) algorithm.
+
+    Annotated input states are accepted: each group of indistinguishable photons (see `BasicState.separate_state`) is
+    sampled independently by its own sampler, prepared once per circuit, and the output occupations of all groups are
+    merged. Fully distinguishable photons (groups of a single photon) are not run through the Clifford algorithm: each
+    of them independently ends in mode j with the probability |U[j, i]|^2, which is sampled directly.
+    """
+    ACCEPTS_ANNOTATED_STATES = True
+
     def __init__(self):
+        super().__init__()
         self._clifford = xq.Clifford2017()
+        self._group_samplers = {}  # Prepared sampler of each group of indistinguishable photons
+        self._groups = None  # Groups of the current input state, if annotated
+        self._distinguishable = None  # Cumulative output mode probabilities of the distinguishable photons
 
     def set_circuit(self, circuit: ACircuit):
         super().set_circuit(circuit)  # Computes circuit unitary as _umat
         self._clifford.set_unitary(self._umat)
+        self._group_samplers.clear()
+        self._groups = None
+        self._distinguishable = None
+
+    def _check_state(self, state: BasicState):
+        assert self._circuit.m == state.m, f'Circuit({self._circuit.m}) and state({state.m}) size mismatch'
 
     def set_input_state(self, input_state: BasicState):
         super().set_input_state(input_state)
-        self._clifford.set_input_state(input_state)
+        self._groups = None
+        self._distinguishable = None
+        if input_state.has_annotations:
+            groups = input_state.separate_state()
+            single_photons = [group.photon2mode(0) for group in groups if group.n == 1]
+            if len(single_photons) > 1:
+                self._distinguishable = np.cumsum(np.abs(np.array(self._umat)[:, single_photons].T) ** 2, axis=1)
+                groups = [group for group in groups if group.n != 1]
+            self._groups = [self._group_sampler(group) for group in groups]
+        else:
+            self._clifford.set_input_state(input_state)
+
+    def _group_sampler(self, group: BasicState) -> xq.Clifford2017:
+        sampler = self._group_samplers.get(group)
+        if sampler is None:
+            sampler = xq.Clifford2017()
+            sampler.set_unitary(self._umat)
+            sampler.set_input_state(group)
+            self._group_samplers[group] = sampler
+        return sampler
+
+    def _sample_distinguishable(self, count: int) -> List[BasicState]:
+        m = self._distinguishable.shape[1]
+        rng = np.random.default_rng()
+        occupations = np.zeros((count, m), dtype=int)
+        for cumulative in self._distinguishable:
+            modes = np.searchsorted(cumulative, rng.random(count) * cumulative[-1], side='right')
+            np.add.at(occupations, (np.arange(count), np.minimum(modes, m - 1)), 1)
+        return [BasicState(state) for state in occupations.tolist()]
 
     def sample(self):
+        if self._groups is not None:
+            return self.samples(1)[0]
         return self._clifford.sample()
 
-    def samples(self, count: int):
-        return self._clifford.samples(count)
+    def samples(self, count: int, n_processes: int = None, seed: int = None):
+        """Request samples from the circuit given an input state
+
+        By default, samples are drawn from a single random stream. When `n_processes` is given, native samplers are run
+        in as many worker processes, each with its own random stream. When a `seed` is given, samples are instead drawn
+        by a (much slower) numpy implementation from independent random streams, one per worker process, derived from
+        `seed`: the samples are then reproducible for a given (`seed`, `n_processes`) pair.
+
+        :param count: number of samples
+        :param n_processes: number of worker processes (default 1)
+        :param seed: seed of the random streams (default: fresh entropy)
+        """
+        n_processes = max(1, n_processes or 1)
+        if n_processes == 1 and seed is None:
+            if self._groups is None:
+                return self._clifford.samples(count)
+            # Merging exqalibur states is faster than converting them to occupation arrays
+            if self._distinguishable is not None:
+                samples = self._sample_distinguishable(count)
+                group_samplers = self._groups
+            else:
+                samples = self._groups[0].samples(count)
+                group_samplers = self._groups[1:]
+            for sampler in group_samplers:
+                samples = [state.merge(other) for state, other in zip(samples, sampler.samples(count))]
+            return BSSamples(samples)
+
+        umat = np.array(self._umat, dtype=complex)
+        groups = self._input_state.separate_state() if self._input_state.has_annotations else [self._input_state]
+        counts = [count // n_processes + (i < count % n_processes) for i in range(n_processes)]
+        if seed is None:
+            # Exqalibur samplers cannot be sent to the workers, which prepare their own from the group occupations
+            groups = [list(group) for group in groups]
+            with ProcessPoolExecutor(max_workers=n_processes) as pool:
+                results = list(pool.map(_sample_native, [umat] * n_processes, [groups] * n_processes, counts))
+        else:
+            groups = [umat[:, [mode for mode in range(group.m) for _ in range(group[mode])]] for group in groups]
+            streams = np.random.SeedSequence(seed).spawn(n_processes)
+            if n_processes == 1:
+                results = [_sample_stream(groups, counts[0], streams[0])]
+            else:
+                with ProcessPoolExecutor(max_workers=n_processes) as pool:
+                    results = list(pool.map(_sample_stream, [groups] * n_processes, counts, streams))
+        output = BSSamples()
+        for result in results:
+            output.extend(BasicState(state) for state in result.tolist())
+        return output
 
     @property
     def name(self) -> str:
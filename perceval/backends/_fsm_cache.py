@@ -0,0 +1,149 @@
+# MIT License
+#
+# Copyright (c) 2022 Quandela
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# As a special exception, the copyright holders of exqalibur library give you
+# permission to combine exqalibur with code included in the standard release of
+# Perceval under the MIT license (or modified versions of such code). You may
+# copy and distribute such a combined system following the terms of the MIT
+# license for both exqalibur and Perceval. This exception for the usage of
+# exqalibur is limited to the python bindings used by Perceval.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import hashlib
+import os
+import time
+import warnings
+from typing import List, Optional
+
+import numpy as np
+
+from perceval.utils import PersistentData
+
+
+class FSMapCache:
+    """Persistent on-disk cache of SLOS Fock space maps.
+
+    A Fock space map links every state of a k-1 photon layer to the k photon states obtained by adding one photon in
+    each mode. Maps are stored as index tables, keyed by (m, k, mask), in the Perceval persistent data directory.
+    Tables are memory-mapped when loaded, so that several processes can share them without rebuilding them.
+
+    The cache size is capped: when storing a new table exceeds `max_size`, the least recently used tables are evicted.
+
+    :param max_size: maximum size of the cache, in bytes (default 1 GB)
+    :param directory: (Optional) cache directory. Defaults to a sub-directory of the persistent data directory.
+    """
+    _FILE_PREFIX = "fsm_"
+
+    def __init__(self, max_size: int = 1 << 30, directory: str = None):
+        assert max_size > 0, "Cache size must be a positive number of bytes"
+        self._max_size = max_size
+        self._last_access = 0
+        if directory is None:
+            directory = os.path.join(PersistentData().directory, "fsm_cache")
+        self._directory = directory
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+        except OSError as exc:
+            warnings.warn(f"Fock space map cache is disabled: {exc}")
+            self._directory = None
+
+    @property
+    def directory(self) -> Optional[str]:
+        return self._directory
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    def _filename(self, m: int, k: int, mask: Optional[List[str]]) -> str:
+        mask_key = "" if mask is None else hashlib.sha1("\n".join(mask).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self._directory, f"{self._FILE_PREFIX}{m}_{k}_{mask_key}.npy")
+
+    def _cached_files(self) -> List[str]:
+        if self._directory is None:
+            return []
+        return [os.path.join(self._directory, f) for f in os.listdir(self._directory)
+                if f.startswith(self._FILE_PREFIX) and f.endswith(".npy")]
+
+    def get(self, m: int, k: int, mask: List[str] = None) -> Optional[np.ndarray]:
+        """Retrieve the memory-mapped index table of the k-th Fock space map, or None if it is not in the cache"""
+        if self._directory is None:
+            return None
+        path = self._filename(m, k, mask)
+        try:
+            table = np.load(path, mmap_mode='r')
+            self._touch(path)
+        except (OSError, ValueError):
+            return None
+        return table
+
+    def put(self, m: int, k: int, mask: Optional[List[str]], table: np.ndarray) -> np.ndarray:
+        """Store the index table of the k-th Fock space map and return its memory-mapped version
+
+        Tables larger than the cache capacity are not stored and are returned as is.
+        """
+        if self._directory is None or table.nbytes > self._max_size:
+            return table
+        self._evict(self._max_size - table.nbytes)
+        path = self._filename(m, k, mask)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, table)
+            os.replace(tmp_path, path)  # Atomic, as several workers may share the cache
+            self._touch(path)
+        except OSError as exc:
+            warnings.warn(f"Cannot write in the Fock space map cache: {exc}")
+            return table
+        return np.load(path, mmap_mode='r')
+
+    def _touch(self, path: str):
+        """Mark a table as the most recently used one, the last modification time being used as the LRU criterion"""
+        # File system timestamps may be coarser than successive accesses: enforce a strictly increasing access time
+        self._last_access = max(time.time_ns(), self._last_access + 1)
+        os.utime(path, ns=(self._last_access, self._last_access))
+
+    def _evict(self, target_size: int):
+        files = []
+        for path in self._cached_files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, path))
+        total_size = sum(f[1] for f in files)
+        for _, size, path in sorted(files):
+            if total_size <= target_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+
+    @property
+    def size(self) -> int:
+        """Current size of the cache, in bytes"""
+        return sum(os.path.getsize(path) for path in self._cached_files())
+
+    def clear(self):
+        for path in self._cached_files():
+            os.remove(path)
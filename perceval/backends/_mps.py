@@ -28,147 +28,470 @@
 # SOFTWARE.
 
 
-import copy
+import hashlib
 import numpy as np
 from math import factorial
 from scipy.special import comb
-from collections import defaultdict
+from typing import List, Optional, Tuple
 
-from ._abstract_backends import AProbAmpliBackend
-from perceval.utils import BasicState
+from ._abstract_backends import AProbAmpliBackend, ASamplingBackend
+from perceval.utils import BasicState, BSDistribution, BSSamples, LRUCache, StateVector
 from perceval.components import ACircuit
 
 
-class MPSBackend(AProbAmpliBackend):
+def _nearest_neighbour_decomposition(u: np.ndarray, precision: float = 1e-12) -> List[Tuple[int, np.ndarray]]:
+    """Decomposes a k-mode unitary into at most k(k-1)/2 2-mode unitaries acting on consecutive modes, followed by
+    k single mode phases.
+
+    The decomposition nulls the sub-diagonal elements of `u`, column by column, with Givens rotations on consecutive
+    rows: G_L ... G_1 u = D is diagonal, so that u = G_1^dagger ... G_L^dagger D. Elements which are already null are
+    skipped, which keeps the decomposition of sparse matrices (e.g. permutations) short.
+
+    :param u: the unitary matrix
+    :return: the list of operations (first mode, unitary matrix) in application order
+    """
+    u = np.array(u, dtype=complex)
+    k = u.shape[0]
+    rotations = []
+    for col in range(k - 1):
+        for row in range(k - 1, col, -1):
+            a, b = u[row - 1, col], u[row, col]
+            if abs(b) < precision:
+                continue
+            r = np.sqrt(abs(a) ** 2 + abs(b) ** 2)
+            g = np.array([[a.conjugate(), b.conjugate()], [-b, a]]) / r
+            u[row - 1:row + 1, :] = g @ u[row - 1:row + 1, :]
+            rotations.append((row - 1, g))
+    operations = [(mode, np.array([[u[mode, mode]]])) for mode in range(k) if abs(u[mode, mode] - 1) > precision]
+    operations += [(mode, g.conj().T) for mode, g in reversed(rotations)]
+    return operations
+
+
+def _transition_tensor_2_mode(u_bytes: bytes, d: int) -> np.ndarray:
+    """Transition tensor U[n1, n2, o1, o2] of a 2-mode component, for at most d-1 photons. The tensor is read-only, as
+    it is shared through the transition cache of the backend (see `MPSBackend.transition_cache`).
+
+    (n1, n2) photons entering the component end as (k1 + k2, n1 + n2 - k1 - k2), where k1 (resp. k2) of the n1
+    (resp. n2) photons are sent to the first output mode. A photon goes from input mode j to output mode i with the
+    amplitude u[i, j].
+    """
+    u11, u12, u21, u22 = np.frombuffer(u_bytes, dtype=complex)
+    idx = np.arange(d)
+    binom = np.array([[comb(a, b, exact=True) for b in range(d)] for a in range(d)], dtype=float)
+    sqrt_fact = np.sqrt(np.array([factorial(a) for a in range(2 * d)], dtype=float))
+    n1, n2, k1, k2 = np.meshgrid(idx, idx, idx, idx, indexing='ij')
+    valid = (k1 <= n1) & (k2 <= n2) & (n1 + n2 < d)
+    n1, n2, k1, k2 = n1[valid], n2[valid], k1[valid], k2[valid]
+    o1 = k1 + k2
+    o2 = n1 + n2 - o1
+    terms = binom[n1, k1] * binom[n2, k2] * u11 ** k1 * u21 ** (n1 - k1) * u12 ** k2 * u22 ** (n2 - k2) \
+        * sqrt_fact[o1] * sqrt_fact[o2] / (sqrt_fact[n1] * sqrt_fact[n2])
+    big_u = np.zeros((d, d, d, d), dtype=complex)
+    np.add.at(big_u, (n1, n2, o1, o2), terms)
+    big_u.setflags(write=False)
+    return big_u
+
+
+class MPSBackend(AProbAmpliBackend, ASamplingBackend):
     """
     The state of the system is written in form of an MPS and
     updated step-by-step by a circuit propagation algorithm.
 
     Approximate the probability amplitudes with a cutoff -> bond Dimension in an MPS.
-    - For now only supports components for up to 2 modes
-    (Phase shifters and Beam Splitters already implemented)
+    - Natively supports components for up to 2 modes (Phase shifters and Beam Splitters)
+    - Wider components (e.g. Unitary, PERM) are decomposed into nearest-neighbour 2-mode operations
+
+    The bond dimension of each bond is adapted after each component: singular values below a threshold are dropped,
+    as well as the smallest ones, as long as their total discarded weight stays below the maximum truncation error
+    (see `set_max_truncation_error`). The cutoff bounds all the bond dimensions.
+
+    Samples are drawn mode by mode from the conditional distributions given by the MPS, without computing the output
+    distribution.
+
+    Compiled MPS are kept in a least recently used cache, bounded by `cache_size` bytes and keyed on a fingerprint of
+    the circuit (its components and their unitaries) and the input state. Switching back to a circuit or an input state
+    already compiled thus does not recompute its MPS.
+
+    Transition tensors of 2-mode components, which hold d^4 amplitudes each, are kept in a second least recently used
+    cache, bounded by `transition_cache_size` bytes and keyed on (unitary, d), as identical components are common in a
+    circuit.
+
+    :param cache_size: maximum size of the compiled MPS cache, in bytes (default 256 MB)
+    :param transition_cache_size: maximum size of the transition tensor cache, in bytes (default 64 MB)
     """
 
-    def __init__(self):
+    SAMPLE_CHUNK_SIZE = 4096  # Number of samples drawn simultaneously
+
+    def __init__(self, cache_size: int = 1 << 28, transition_cache_size: int = 1 << 26):
         super().__init__()
         self._s_min = 1e-8  # minimum accepted value for singular values
         self._cutoff = None  # Bond dimension of MPS
-        self._compiled_input = None
-        self._current_input = None
-        self._res = defaultdict(lambda: defaultdict(lambda: np.array([0])))
-        # _res stores output of the state compilation in MPS.
-        # It is a Nested DefaultDict.
-        # 1st layer: Each "input_states" has the full MPS
-        # 2nd layer: gamma or lambda keys and their numpy arrays
+        self._max_error = None  # Maximum discarded weight of each truncation
+        self._cache = LRUCache(cache_size)
+        self._transition_cache = LRUCache(transition_cache_size)
+        # _cache stores the output of the state compilations in MPS: for each (circuit fingerprint, truncation
+        # settings, input state) key, a dictionary containing the gamma tensors and sv vectors, the truncation error
+        # and, once computed, the right environments used for sampling.
+        self._fingerprint = None  # (variable parameter values, fingerprint of the circuit with these values)
+        self._entry = None  # Compiled MPS of the current input state
+        self._entry_key = None
+        self._gamma = []
+        self._sv = []
+        self._truncation_error = 0
+        self._chi_max = None
 
     @property
     def name(self) -> str:
         return "MPS"
 
+    @classmethod
+    def estimate_cost(cls, circuit: ACircuit, input_state: BasicState, output_count: int = None):
+        # Components acting on k > 2 modes are decomposed into (up to) k(k-1)/2 2-mode components
+        operations = sum(len(r) * (len(r) - 1) // 2 if len(r) > 2 else 1 for r, _ in circuit)
+        # Default bond dimension chi = d = n + 1: each component costs an SVD of a (d.chi) x (d.chi) matrix,
+        # then each output amplitude is a contraction of m (chi x chi) matrices
+        d = input_state.n + 1
+        if output_count is None:
+            output_count = cls._output_space_size(input_state)
+        return {"time": operations * (5e-4 + 2.5e-8 * d ** 6) + output_count * circuit.m * 1.5e-4,
+                "memory": 16 * circuit.m * d ** 3}
+
     def set_cutoff(self, cutoff_val: int):
         """
         Cut-off defines the Bond dimension (Schmidt rank of the decomposition of the
         state) of an MPS; in other words, how well approximated the state is.
-        Default value is the total number of photons + 1.
+        Default value is the total number of photons + 1, or no limit when a maximum truncation error is set.
         """
         assert isinstance(cutoff_val, int), "cutoff must be an integer"
         self._cutoff = cutoff_val
 
+    def set_max_truncation_error(self, max_error: float):
+        """
+        Error targeted mode: after each component, the smallest singular values of the updated bond are discarded as
+        long as their total weight (sum of their squares, relative to the sum of all squared singular values) does not
+        exceed `max_error`. Bond dimensions thus grow or shrink bond per bond, to the accuracy needed.
+
+        :param max_error: maximum discarded weight of each truncation, or None to only use the cutoff
+        """
+        assert max_error is None or max_error >= 0, "Maximum truncation error must be positive"
+        self._max_error = max_error
+
+    @property
+    def cache(self) -> LRUCache:
+        """Cache of the compiled MPS"""
+        return self._cache
+
+    @property
+    def transition_cache(self) -> LRUCache:
+        """Cache of the transition tensors of 2-mode components"""
+        return self._transition_cache
+
+    @property
+    def truncation_error(self) -> float:
+        """Cumulative weight of the singular values discarded while compiling the current input state"""
+        return self._truncation_error
+
+    @property
+    def bond_dimensions(self) -> List[int]:
+        """Dimension of each of the m-1 bonds of the current input state's MPS"""
+        return [len(sv) for sv in self._sv]
+
     def set_circuit(self, circuit: ACircuit):
         super().set_circuit(circuit)
-        C = self._circuit
-        for r, c in C:
-            assert c.compute_unitary(use_symbolic=False).shape[0] <= 2, \
-                "MPS backend can not be used with components of using more than 2 modes"
+        self._fingerprint = None
 
     def set_input_state(self, input_state: BasicState):
         super().set_input_state(input_state)
-        self._compile()
+        self._entry_key, self._entry = self._compile([input_state])[0]
+        self._load(self._entry)
+
+    def compile(self, input_states: List[BasicState]):
+        """
+        Compiles the MPS of several input states in a single pass over the circuit, and stores them in the cache so
+        that setting any of these input states afterwards is immediate. Component unitaries, their decompositions and
+        transition tensors are computed once for all the input states.
+
+        :param input_states: the input states to compile
+        """
+        for input_state in input_states:
+            self._check_state(input_state)
+        self._compile(input_states)
 
     def prob_amplitude(self, output_state: BasicState) -> complex:
         """
         Computes the probability for a given input output state from a circuit with m modes and
         n photons computed using MPS
         """
-        # self._res extracts gamma and diagonal SV matrices corresponding to given output_state; this is
-        # stored in list of matrices and multidot performs a full matrix multiplication overall of them
-        # in a single statement. Optimized by numpy
+        # The gamma matrices corresponding to the photon counts of output_state are
+        # multiplied one after the other, singular values being applied as a scaling of the bond index
 
         m = self._input_state.m
-        mps_in_list = []
-        self._current_input = tuple(self._input_state)
-        for k in range(m - 1):
-            mps_in_list.append(self._res[tuple(self._input_state)]["gamma"][k, :, :, output_state[k]])
-            # _res[1ST LEVEL: selects given input state][2ND LEVEL: selects "gamma" matrix key of that]
-            # [3RD LEVEL: for a gamma -> chooses kth mode and then segment
-            # with #photons equal to that in output_state considered]
-            mps_in_list.append(self._sv_diag(k))
-
-        mps_in_list.append(self._res[tuple(self._input_state)]["gamma"][m - 1, :, :, output_state[m - 1]])
-        # Inserting the last gamma into MPS outside the loop as there is no sv after that.
-        return np.linalg.multi_dot(mps_in_list)[0, 0]
-
-    def _compile(self) -> bool:
-        C = self._circuit
-        var = [float(p) for p in C.get_parameters()]
-        if self._compiled_input and self._compiled_input[0] == var and self._input_state in self._res:
-            # checks if a given input state for a circuit is already computed
-            return False
-        self._compiled_input = copy.copy((var, self._input_state))
-        self._current_input = None
-
-        self._n = self._input_state.n  # total number of photons
-        self._d = self._n + 1  # possible num of photons in each mode {0,1,2,...,n}
-
-        if self._cutoff is None or self._cutoff < self._d:
-            self._cutoff = self._d
-            # sets the default value of cut-off to max number of photons (also min computation value needed)
-        self._cutoff = min(self._cutoff, self._d ** (self._input_state.m//2))
-        # choosing a cut-off smaller than the limit as the size of matrix increases
-        # exponentially with cutoff
-        # this is the Schmidt's rank or bond dimension (chi in Thibaud's notes)
-
-        self._gamma = np.zeros((self._input_state.m, self._cutoff, self._cutoff, self._d), dtype='complex_')
-        # Gamma matrices of the MPS - array shape (m, chi, chi, d)
-        # Each Gamma matrix of MPS, in theory, have 3 indices.
-        # The first index 'm' here is used to represent modes - all gammas of MPS stored in a single array
-        for i in range(self._input_state.m):
-            self._gamma[i, 0, 0, self._input_state[i]] = 1
-
-        self._sv = np.zeros((self._input_state.m, self._cutoff))
-        # sv matrices store singular values - array shape (m, chi)
-        # sv are vectors of length chi. Similar to gamma, the first index 'm' indexes mode.
-        self._sv[:, 0] = 1  # first column set to 1
+        gamma = self._gamma
+        sv = self._sv
+        result = gamma[0][:, :, output_state[0]]
+        for k in range(1, m):
+            # gamma[k][:, :, i] is the matrix of the k-th mode with i photons
+            result = (result * sv[k - 1]) @ gamma[k][:, :, output_state[k]]
+        return result[0, 0]
+
+    def prob_amplitudes(self, output_states: List[BasicState]) -> np.ndarray:
+        """
+        Computes the probability amplitudes of several output states. Output states sharing their first occupations
+        share the contraction of the corresponding left part of the MPS.
+        """
+        result = np.zeros(len(output_states), dtype=complex)
+        matching = [i for i, state in enumerate(output_states) if state.n == self._input_state.n]
+        if not matching:
+            return result
+        states = np.array([list(output_states[i]) for i in matching], dtype=int).reshape(len(matching), -1)
+        gamma = self._gamma
+        sv = self._sv
+
+        # Unique prefixes of each length, each row of `partial` being the left contraction of one prefix
+        prefixes, inverse = np.unique(states[:, :1], axis=0, return_inverse=True)
+        partial = gamma[0][0, :, prefixes[:, 0]]  # shape=(prefix count, chi)
+        for k in range(1, states.shape[1]):
+            new_prefixes, new_inverse = np.unique(states[:, :k + 1], axis=0, return_inverse=True)
+            parents = np.empty(len(new_prefixes), dtype=int)
+            parents[new_inverse.reshape(-1)] = inverse.reshape(-1)
+            partial = self._extend_partial(partial[parents] * sv[k - 1], gamma[k], new_prefixes[:, k])
+            prefixes, inverse = new_prefixes, new_inverse
+        result[matching] = partial[inverse.reshape(-1), 0]
+        return result
+
+    def _all_amplitudes(self):
+        """
+        Computes the probability amplitudes of all the output states by a breadth-first traversal of the tree of
+        output occupations: each prefix of occupations is contracted once, and shared by all its output states.
+
+        :return: the (N, m) array of output states and their N probability amplitudes
+        """
+        gamma = self._gamma
+        sv = self._sv
+        n = self._input_state.n
+        m = self._input_state.m
+
+        occupations = np.arange(n + 1)[:, np.newaxis] if m > 1 else np.array([[n]])
+        partial = gamma[0][0, :, occupations[:, 0]]  # shape=(prefix count, chi)
+        for k in range(1, m):
+            remaining = n - occupations.sum(axis=1)
+            if k == m - 1:
+                # The last mode receives all the remaining photons
+                partial = self._extend_partial(partial * sv[k - 1], gamma[k], remaining)
+                occupations = np.hstack([occupations, remaining[:, np.newaxis]])
+                break
+            new_occupations = []
+            new_partial = []
+            for count in range(n + 1):
+                selected = np.nonzero(remaining >= count)[0]
+                photons = np.full(len(selected), count)
+                new_occupations.append(np.hstack([occupations[selected], photons[:, np.newaxis]]))
+                new_partial.append(self._extend_partial(partial[selected] * sv[k - 1], gamma[k], photons))
+            occupations = np.vstack(new_occupations)
+            partial = np.vstack(new_partial)
+        return occupations, partial[:, 0]
+
+    @staticmethod
+    def _extend_partial(partial: np.ndarray, gamma: np.ndarray, photons: np.ndarray) -> np.ndarray:
+        """Contracts each row of `partial` with the gamma tensor slice corresponding to its photon count"""
+        result = np.empty((len(partial), gamma.shape[1]), dtype=complex)
+        for count in np.unique(photons):
+            rows = np.nonzero(photons == count)[0]
+            result[rows] = partial[rows] @ gamma[:, :, count]
+        return result
+
+    def prob_distribution(self) -> BSDistribution:
+        bsd = BSDistribution()
+        states, amplitudes = self._all_amplitudes()
+        for state, amplitude in zip(states.tolist(), amplitudes):
+            bsd.add(BasicState(state), abs(amplitude) ** 2)
+        return bsd
+
+    def marginal_distribution(self, modes: List[int]) -> BSDistribution:
+        """Photon count distribution on a subset of the output modes, traced out from the output distribution of the
+        (truncated) MPS. Contrary to the exact backends, the whole output space is enumerated."""
+        return self._traced_out_distribution(self._check_modes(modes))
+
+    def threshold_prob_distribution(self) -> BSDistribution:
+        """Click pattern distribution of threshold detectors, collapsed from the output distribution of the
+        (truncated) MPS"""
+        return self._collapsed_click_patterns()
+
+    def evolve(self) -> StateVector:
+        res = StateVector()
+        states, amplitudes = self._all_amplitudes()
+        for state, amplitude in zip(states.tolist(), amplitudes):
+            res += BasicState(state) * complex(amplitude)
+        res.normalize()
+        return res
+
+    def _right_environments(self) -> List[np.ndarray]:
+        """
+        Right environments of the MPS: R[k] is the (chi x chi) contraction of the modes k to m-1 with their conjugate,
+        over all their occupations, leaving the left bond of mode k open. R[m] is the trivial 1x1 environment.
+        """
+        if "env" in self._entry:
+            return self._entry["env"]
+        m = self._input_state.m
+        env = [np.ones((1, 1), dtype=complex)]
+        for k in range(m - 1, -1, -1):
+            a = self._gamma[k] if k == 0 else self._gamma[k] * self._sv[k - 1][:, np.newaxis, np.newaxis]
+            env.append(np.einsum('abo,bc,dco->ad', a, env[-1], a.conj()))
+        self._entry["env"] = env[::-1]
+        self._cache.put(self._entry_key, self._entry)  # Updates the size of the cached entry
+        return self._entry["env"]
+
+    def sample(self) -> BasicState:
+        return self.samples(1)[0]
+
+    def samples(self, count: int) -> BSSamples:
+        """
+        Draws output states from the MPS, one mode after the other: the occupation of mode k is drawn knowing the
+        occupations of modes 0 to k-1, from the contraction of the sampled left part of the MPS with the right
+        environment of mode k+1. The last mode receives all the remaining photons.
+        """
+        result = BSSamples()
+        for start in range(0, count, self.SAMPLE_CHUNK_SIZE):
+            for state in self._sample_chunk(min(self.SAMPLE_CHUNK_SIZE, count - start)).tolist():
+                result.append(BasicState(state))
+        return result
+
+    def _sample_chunk(self, count: int) -> np.ndarray:
+        env = self._right_environments()
+        n = self._input_state.n
+        m = self._input_state.m
+        occupations = np.zeros((count, m), dtype=int)
+        remaining = np.full(count, n)
+        left = np.ones((count, 1), dtype=complex)  # Left contraction of the occupations drawn so far
+        rows = np.arange(count)
+        for k in range(m):
+            a = self._gamma[k] if k == 0 else self._gamma[k] * self._sv[k - 1][:, np.newaxis, np.newaxis]
+            if k == m - 1:
+                occupations[:, k] = remaining
+                break
+            candidates = np.einsum('sa,abo->osb', left, a)  # shape=(d, count, chi)
+            probs = np.einsum('osa,ab,osb->so', candidates, env[k + 1], candidates.conj()).real
+            probs[np.arange(self._d)[np.newaxis, :] > remaining[:, np.newaxis]] = 0
+            probs = np.maximum(probs, 0)
+            cumulated = np.cumsum(probs, axis=1)
+            draws = np.random.random(count) * cumulated[:, -1]
+            photons = np.minimum(np.count_nonzero(cumulated <= draws[:, np.newaxis], axis=1), remaining)
+            occupations[:, k] = photons
+            remaining -= photons
+            left = candidates[photons, rows]
+            # Rescaling does not change the conditional distributions, and avoids underflows
+            left /= np.maximum(np.linalg.norm(left, axis=1), np.finfo(float).tiny)[:, np.newaxis]
+        return occupations
+
+    def _circuit_fingerprint(self) -> str:
+        """Digest of the circuit components, their modes and unitaries. Recomputed only when parameters change."""
+        values = tuple(float(p) for p in self._circuit.get_parameters())
+        if self._fingerprint is None or self._fingerprint[0] != values:
+            digest = hashlib.sha1()
+            for r, c in self._circuit:
+                digest.update(np.array([len(r), *r], dtype=np.int64).tobytes())
+                digest.update(np.asarray(c.compute_unitary(use_symbolic=False), dtype=complex).tobytes())
+            self._fingerprint = (values, digest.hexdigest())
+        return self._fingerprint[1]
+
+    def _max_bond_dimension(self, d: int) -> Optional[int]:
+        """Maximal Schmidt's rank or bond dimension (chi in Thibaud's notes) of the MPS of states with d-1 photons"""
+        if self._max_error is None and (self._cutoff is None or self._cutoff < d):
+            return d  # default value of cut-off: max number of photons + 1 (also min computation value needed)
+        return self._cutoff
+
+    @staticmethod
+    def _initial_mps(input_state: BasicState, chi_max: int) -> dict:
+        d = input_state.n + 1  # possible num of photons in each mode {0,1,2,...,n}
+        m = input_state.m
+        gamma = [np.zeros((1, 1, d), dtype=complex) for _ in range(m)]
+        # Gamma tensors of the MPS - array shape (chi_left, chi_right, d)
+        # Each Gamma tensor of MPS has 3 indices: its left bond, its right bond and the photon count of its mode.
+        # Bond dimensions are adapted to each bond, the edge bonds having a dimension of 1
+        for i in range(m):
+            gamma[i][0, 0, input_state[i]] = 1
+
+        sv = [np.ones(1) for _ in range(m - 1)]
+        # sv are vectors of singular values, one for each of the m-1 bonds between consecutive modes
 
         # This initialization of MPS (gamma and sv) fixes the input state to be completely separable
         # and a pure BasicState (no superposition); hence would have only 1 non-zero element whose value = 1.
         # It is simply written based on this choice as the SVD of such a structure would exactly look like this
         # methods currently available in ITensors(Julia), Qiskit
+        return {"gamma": gamma, "sv": sv, "truncation_error": 0, "d": d, "chi_max": chi_max}
 
-        for r, c in C:
-            # r -> tuple -> lists the modes where the component c is connected
-            self._apply(r, c)
+    def _load(self, entry: dict):
+        """Makes a compiled (or being compiled) MPS the current one"""
+        self._gamma = entry["gamma"]
+        self._sv = entry["sv"]
+        self._truncation_error = entry["truncation_error"]
+        self._d = entry["d"]
+        self._chi_max = entry["chi_max"]
 
-        self._res[tuple(self._input_state)]["gamma"] = self._gamma.copy()
-        self._res[tuple(self._input_state)]["sv"] = self._sv.copy()
+    def _compile(self, input_states: List[BasicState]) -> List[Tuple[tuple, dict]]:
+        """
+        Retrieves the MPS of input states from the cache, and compiles the missing ones in a single pass over the
+        circuit.
 
-        return True
+        :return: the (cache key, compiled MPS) pair of each input state
+        """
+        fingerprint = self._circuit_fingerprint()
+        keys = []
+        compiled = {}
+        missing = {}
+        for input_state in input_states:
+            chi_max = self._max_bond_dimension(input_state.n + 1)
+            key = (fingerprint, chi_max, self._max_error, tuple(input_state))
+            keys.append(key)
+            entry = self._cache.get(key)
+            if entry is not None:
+                compiled[key] = entry
+            elif key not in missing:
+                missing[key] = self._initial_mps(input_state, chi_max)
+
+        if missing:
+            for r, c in self._circuit:
+                # r -> tuple -> lists the modes where the component c is connected
+                operations = self._component_operations(c.compute_unitary(use_symbolic=False))
+                for entry in missing.values():
+                    self._load(entry)
+                    self._apply(r, operations)
+                    entry["truncation_error"] = self._truncation_error
+            for key, entry in missing.items():
+                self._cache.put(key, entry)
+                compiled[key] = entry
+            if self._entry is not None:
+                self._load(self._entry)  # Compiling other states must not change the current one
+        return [(key, compiled[key]) for key in keys]
+
+    @staticmethod
+    def _component_operations(u) -> List[Tuple[int, np.ndarray]]:
+        """
+        Operations of at most 2 modes applying a component: wider components are decomposed into a sequence of
+        nearest-neighbour operations.
+
+        :param u: The unitary matrix of the component
+        :return: a list of (mode offset, unitary matrix) pairs
+        """
+        if len(u) > 2:
+            return _nearest_neighbour_decomposition(u)
+        return [(0, u)]
 
-    def _apply(self, r, c):
+    def _apply(self, r, operations: List[Tuple[int, np.ndarray]]):
         """
         Applies the components of the circuit iteratively to update the MPS.
 
         :param r: List of the mode positions for a component of the Circuit
-        :param c: The component
+        :param operations: The operations applying the component (see `_component_operations`)
         """
-        u = c.compute_unitary(False)
         k_mode = r[0]  # k-th mode is where the upper mode(only) of the BS(PS) component is connected
-        if len(u) == 2:
-            # BS
-            self.update_state_2_mode(k_mode, u)  # --> quandelibc
-        elif len(u) == 1:
-            # PS
-            self.update_state_1_mode(k_mode, u)  # --> quandelibc
+        for mode, v in operations:
+            if len(v) == 2:
+                # BS
+                self.update_state_2_mode(k_mode + mode, v)  # --> quandelibc
+            else:
+                # PS
+                self.update_state_1_mode(k_mode + mode, v)  # --> quandelibc
 
 ########################################################################################
 
@@ -178,10 +501,10 @@ class MPSBackend(AProbAmpliBackend):
         and the transition matrix "U" of phase shifter for that mode [_transition_matrix_1_mode].
         """
         self._gamma[k] = np.tensordot(self._gamma[k], self._transition_matrix_1_mode(u), axes=(2, 0))
-        # gamma[k] -> takes the kth slice from first dimension -> selects gamma of kth mode
-        # gamma[k].shape=(chi, chi, d) and _transition_matrix_1_mode(u).shape=(d, d).
+        # gamma[k] -> gamma of kth mode
+        # gamma[k].shape=(chi_left, chi_right, d) and _transition_matrix_1_mode(u).shape=(d, d).
         # The contraction is on the free index 'd'.
-        # Assigns the result to the same gamma[k] returning the shape (chi, chi, d)
+        # Assigns the result to the same gamma[k] returning the shape (chi_left, chi_right, d)
 
     def _transition_matrix_1_mode(self, u):
         """
@@ -194,11 +517,7 @@ class MPSBackend(AProbAmpliBackend):
         :param u: the unitary matrix for single mode component - PS
         :returns big_u: np.ndarray of the corresponding transition matrix
         """
-        d = self._d
-        big_u = np.zeros((d, d), dtype='complex_')
-        for i in range(d):
-            big_u[i, i] = u[0, 0] ** i
-        return big_u
+        return np.diag(complex(u[0, 0]) ** np.arange(self._d))
 
     def update_state_2_mode(self, k, u):
         """
@@ -206,68 +525,55 @@ class MPSBackend(AProbAmpliBackend):
         with 2 mode beam splitter, performs some reshaping and then svd to re-build the corresponding
         segment of MPS.
         """
-
-        if 0 < k < self._input_state.m - 2:  # BS anywhere except the first and the last mode
-            # all gamma[k,:].shape=(chi, chi, d) and _sv_diag(k).shape=(chi, chi)
-            theta = np.tensordot(self._sv_diag(k - 1), self._gamma[k, :], axes=(1, 0))  # theta.shape=(chi,chi,d)
-            theta = np.tensordot(theta, self._sv_diag(k), axes=(1, 0))  # theta.shape=(chi, d, chi)
-            theta = np.tensordot(theta, self._gamma[k + 1, :], axes=(2, 0))  # theta.shape=(chi, d, chi, d)
-            theta = np.tensordot(theta, self._sv_diag(k + 1), axes=(2, 0))  # theta.shape=(chi, d, d, chi)
-            # contraction of the corresponding matrices of MPS finished until here
-            theta = np.tensordot(theta, self._transition_matrix_2_mode(u), axes=([1, 2], [0, 1]))
-            # input->theta.shape=(chi, d, d, chi) and big_u.shape(d,d,d,d)
-            # output->theta.shape(chi, chi, d, d)
-
-        elif k == 0:
-            # BS connected between the first 2 modes -> Edge of circuit
-            # all gamma[k,:].shape=(chi, chi, d) and _sv_diag(k).shape=(chi, chi)
-            theta = np.tensordot(self._gamma[k, :], self._sv_diag(k), axes=(1, 0))  # theta.shape=(chi, d, chi)
-            theta = np.tensordot(theta, self._gamma[k + 1, :], axes=(2, 0))  # theta.shape=(chi, d, chi, d)
-            theta = np.tensordot(theta, self._sv_diag(k + 1), axes=(2, 0))  # theta.shape=(chi, d, d, chi)
-            theta = np.tensordot(theta, self._transition_matrix_2_mode(u), axes=([1, 2], [0, 1]))
-            # input->theta.shape=(chi, d, d, chi) and big_u.shape(d,d,d,d)
-            # output->theta.shape(chi, chi, d, d)
-
-        elif k == self._input_state.m - 2:
-            # BS connected between the last 2 modes -> Edge of circuit
-            # all gamma[k,:].shape=(chi, chi, d) and _sv_diag(k).shape=(chi, chi)
-            theta = np.tensordot(self._sv_diag(k - 1), self._gamma[k, :], axes=(1, 0))  # theta.shape=(chi,chi,d)
-            theta = np.tensordot(theta, self._sv_diag(k), axes=(1, 0))  # theta.shape=(chi, d, chi)
-            theta = np.tensordot(theta, self._gamma[k + 1, :], axes=(2, 0))  # theta.shape=(chi, d, chi, d)
-            theta = np.tensordot(theta, self._transition_matrix_2_mode(u), axes=([1, 3], [0, 1]))
-            # input->theta.shape = (chi, d, chi, d) and big_u.shape(d, d, d, d)
-            # output->theta.shape(chi, chi, d, d)
-
-        theta = theta.swapaxes(1, 2).swapaxes(0, 1).swapaxes(2, 3)  # resulting theta.shape(d, chi, d, chi)
-        theta = theta.reshape(self._d * self._cutoff, self._d * self._cutoff)  # theta.shape (d x chi, d x chi)
-        v, s, w = np.linalg.svd(theta)
+        m = len(self._gamma)
+        # gamma[k].shape=(chi_l, chi, d), gamma[k+1].shape=(chi, chi_r, d). Outer singular values (if any) are
+        # applied on the outer bonds, and the singular values of bond k on the inner one
+        left = self._gamma[k] if k == 0 else self._gamma[k] * self._sv[k - 1][:, np.newaxis, np.newaxis]
+        right = self._gamma[k + 1] if k == m - 2 else self._gamma[k + 1] * self._sv[k + 1][np.newaxis, :, np.newaxis]
+        theta = np.einsum('aci,c,cbj->aijb', left, self._sv[k], right)  # theta.shape=(chi_l, d, d, chi_r)
+        # contraction of the corresponding matrices of MPS finished until here
+        theta = np.tensordot(theta, self._transition_matrix_2_mode(u), axes=([1, 2], [0, 1]))
+        # input->theta.shape=(chi_l, d, d, chi_r) and big_u.shape(d,d,d,d)
+        # output->theta.shape(chi_l, chi_r, d, d)
+
+        chi_l, chi_r = theta.shape[0], theta.shape[1]
+        theta = theta.transpose(2, 0, 3, 1)  # resulting theta.shape(d, chi_l, d, chi_r)
+        theta = theta.reshape(self._d * chi_l, self._d * chi_r)  # theta.shape (d x chi_l, d x chi_r)
+        v, s, w = np.linalg.svd(theta, full_matrices=False)
         # svd of the tensor after component is applied to extract the MPS form
         # in standard notation SVD is written as M=USV, but we keep 'u' for unitary,
-        # Here:: U->v [v.shape=(d x chi, d x chi)], (1st in the new MPS chain)
-        # S->s [s.shape=(d x chi)], V->w [w.shape=(d x chi, d x chi)]
+        # Here:: U->v [v.shape=(d x chi_l, r)], (1st in the new MPS chain)
+        # S->s [s.shape=(r)], V->w [w.shape=(r, d x chi_r)]
 
-        v = v.reshape(self._d, self._cutoff, self._d * self._cutoff).swapaxes(0, 1).swapaxes(1, 2)[:, :self._cutoff]
-        w = w.reshape(self._d * self._cutoff, self._d, self._cutoff).swapaxes(1, 2)[:self._cutoff]
-        s = s[:self._cutoff]  # restricting the size of SV matrices to cut_off -> truncation
+        chi = self._truncate(s)
+        v = v[:, :chi].reshape(self._d, chi_l, chi).transpose(1, 2, 0)  # v.shape=(chi_l, chi, d)
+        w = w[:chi].reshape(chi, self._d, chi_r).swapaxes(1, 2)  # w.shape=(chi, chi_r, d)
 
         # updating corresponding sv after the action of BS
-        self._sv[k] = np.where(s > self._s_min, s, 0)
-
-        # updating self._gamma[k] :: uses v from SVD above
-        if k > 0:
-            rank = np.nonzero(self._sv[k - 1])[0][-1] + 1
-            self._gamma[k, :rank] = v[:rank] / self._sv[k - 1, :rank][:, np.newaxis, np.newaxis]
-            self._gamma[k, rank:] = 0
-        else:
-            self._gamma[k] = v
+        self._sv[k] = s[:chi]
 
+        # updating self._gamma[k] :: uses v from SVD above, removing the outer singular values
+        self._gamma[k] = v if k == 0 else v / self._sv[k - 1][:, np.newaxis, np.newaxis]
         # updating self._gamma[k+1] :: uses w from SVD above
-        if k < self._input_state.m - 2:
-            rank = np.nonzero(self._sv[k + 1])[0][-1] + 1
-            self._gamma[k + 1, :, :rank] = (w[:, :rank] / self._sv[k + 1, :rank][:, np.newaxis])
-            self._gamma[k + 1, :, rank:] = 0
-        else:
-            self._gamma[k + 1] = w
+        self._gamma[k + 1] = w if k == m - 2 else w / self._sv[k + 1][np.newaxis, :, np.newaxis]
+
+    def _truncate(self, s: np.ndarray) -> int:
+        """
+        Number of singular values (sorted in decreasing order) to keep, i.e. the new bond dimension, and update of the
+        truncation error with the discarded weight.
+        """
+        chi = max(1, int(np.count_nonzero(s > self._s_min)))
+        if self._chi_max is not None:
+            chi = min(chi, self._chi_max)
+        weights = s ** 2
+        total = weights.sum()
+        if self._max_error is not None and total > 0:
+            # discarded weight when keeping the first i singular values
+            tail = (total - np.cumsum(weights)) / total
+            chi = min(chi, int(np.argmax(tail <= self._max_error)) + 1)
+        if total > 0:
+            self._truncation_error += weights[chi:].sum() / total
+        return chi
 
     def _transition_matrix_2_mode(self, u):
         """
@@ -278,33 +584,9 @@ class MPSBackend(AProbAmpliBackend):
         The formula for constructing the larger U to contract with the MPS is in
         Thibaud report.
         """
-        u11, u12, u21, u22 = u[0, 0], u[0, 1], u[1, 0], u[1, 1]
-        d = self._d
-        # matrix corresponding to action of BS on the 2 modes
-        big_u = np.zeros((d, d, d, d), dtype='complex_')
-        for n1 in range(d):  # n1 -> number of photons in mode 1
-            for n2 in range(d):  # n2 -> number of photons in mode 2
-                n_tot = n1 + n2
-                outputs = np.zeros((d, d), dtype='complex_')  # unitary of BS for a fixed n1 and n2 entering the modes
-                if n_tot <= self._n:  # cannot exceed the total number of photons in the circuit
-                    for k1 in range(n1+1):
-                        for k2 in range(n2+1):
-                            # of those (n1,n2) entering -> (k1,k2) combinations
-                            outputs[k1 + k2, n_tot - (k1 + k2)] += comb(n1, k1) * comb(n2, k2) \
-                                                                * (u11**k1 * u12**(n1-k1) * u21**k2 * u22**(n2-k2)) \
-                                                                * (np.sqrt(factorial(k1+k2) * factorial(n_tot-k1-k2)))
-                big_u[n1, n2, :] = outputs / (np.sqrt(factorial(n1) * factorial(n2)))
+        key = (np.asarray(u, dtype=complex).tobytes(), self._d)
+        big_u = self._transition_cache.get(key)
+        if big_u is None:
+            big_u = _transition_tensor_2_mode(*key)
+            self._transition_cache.put(key, big_u)
         return big_u
-
-    def _sv_diag(self, k):
-        """
-        Creates the diagonal matrix containing the singular values of
-        the matrices in the MPS.
-        """
-        if self._res[self._current_input]["sv"].any():
-            sv = self._res[self._current_input]["sv"]
-        else:
-            sv = self._sv
-        sv_diag = np.zeros((self._cutoff, self._cutoff))
-        np.fill_diagonal(sv_diag, sv[k, :])
-        return sv_diag
@@ -29,36 +29,99 @@
 
 import math
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 
 import exqalibur as xq
 from ._abstract_backends import AProbAmpliBackend
+from perceval.components import ACircuit
 from perceval.utils import BasicState
+from perceval.utils.qmath import permanent_with_multiplicities
+
+
+def _prefer_multiplicities(n: int, row_multiplicities: List[int], col_multiplicities: List[int]) -> bool:
+    """Whether the permanent of a matrix with repeated rows and columns is faster to compute by grouping the repeated
+    columns (see `permanent_with_multiplicities`) than by a plain n x n permanent. Timings measured on both methods."""
+    terms = min(math.prod(t + 1 for t in row_multiplicities), math.prod(s + 1 for s in col_multiplicities))
+    return 1e-4 + 2.5e-8 * terms * (len(col_multiplicities) + n) < 1.5e-9 * n * 2 ** n
 
 
 class NaiveBackend(AProbAmpliBackend):
     """Naive algorithm, no clever calculation path, does not cache anything,
-       recompute all states on the fly"""
+       recompute all states on the fly
+
+    Bunched states (several photons per mode) are handled by a permanent algorithm grouping the repeated rows and
+    columns, whenever it is cheaper than the permanent of the n x n matrix.
+
+    :param n_threads: (Optional) number of threads used to compute the permanents of `prob_amplitudes` in parallel.
+        Default is a serial computation.
+    """
+
+    def __init__(self, n_threads: int = None):
+        super().__init__()
+        assert n_threads is None or n_threads > 0, "Thread count must be a positive integer"
+        self._n_threads = n_threads
+        self._u_in = None
+
+    def set_circuit(self, circuit: ACircuit):
+        super().set_circuit(circuit)
+        self._u_in = None
+
+    def set_input_state(self, input_state: BasicState):
+        super().set_input_state(input_state)
+        # Unitary matrix columns of each input photon, shared by all the output states
+        self._u_in = np.asarray(self._umat, dtype=complex)[:, self._photon_modes(input_state)]
+        self._in_modes = [mode for mode in range(input_state.m) if input_state[mode]]
+        self._in_multiplicities = [input_state[mode] for mode in self._in_modes]
+
+    @staticmethod
+    def _photon_modes(state: BasicState) -> List[int]:
+        return [mode for mode in range(state.m) for _ in range(state[mode])]
 
     @property
     def name(self) -> str:
         return "Naive"
 
+    @classmethod
+    def estimate_cost(cls, circuit: ACircuit, input_state: BasicState, output_count: int = None):
+        # One n x n permanent (Ryser's formula: n.2^n operations) per requested output state
+        n = input_state.n
+        if output_count is None:
+            output_count = cls._output_space_size(input_state)
+        return {"time": output_count * (1e-4 + 3e-9 * n * 2 ** n),
+                "memory": 16 * n * n}
+
     def prob_amplitude(self, output_state: BasicState) -> complex:
         n = self._input_state.n
-        m = self._input_state.m
         if n != output_state.n:
             return complex(0)
         if n == 0:
             return complex(1)
-        u_st = np.empty((n, n), dtype=complex)
-        colidx = 0
         p = output_state.prodnfact() * self._input_state.prodnfact()
-        for ik in range(m):
-            for i in range(self._input_state[ik]):
-                rowidx = 0
-                for ok in range(m):
-                    for j in range(output_state[ok]):
-                        u_st[rowidx, colidx] = self._umat[ok, ik]
-                        rowidx += 1
-                colidx += 1
-        return xq.permanent_cx(u_st, n_threads=1)/math.sqrt(p)
+        return self._permanent(output_state)/math.sqrt(p)
+
+    def _permanent(self, output_state: BasicState) -> complex:
+        out_modes = [mode for mode in range(output_state.m) if output_state[mode]]
+        out_multiplicities = [output_state[mode] for mode in out_modes]
+        if _prefer_multiplicities(self._input_state.n, out_multiplicities, self._in_multiplicities):
+            u_distinct = np.asarray(self._umat, dtype=complex)[np.ix_(out_modes, self._in_modes)]
+            return permanent_with_multiplicities(u_distinct, out_multiplicities, self._in_multiplicities)
+        # Output photon rows of the input photon columns
+        return xq.permanent_cx(self._u_in[self._photon_modes(output_state)], n_threads=1)
+
+    def prob_amplitudes(self, output_states: List[BasicState]) -> np.ndarray:
+        n = self._input_state.n
+        if n == 0:
+            return np.array([complex(output_state.n == 0) for output_state in output_states], dtype=complex)
+        matching = [output_state for output_state in output_states if output_state.n == n]
+        norms = np.sqrt(np.array([output_state.prodnfact() for output_state in matching], dtype=float)
+                        * self._input_state.prodnfact())
+        if self._n_threads and self._n_threads > 1:
+            with ThreadPoolExecutor(max_workers=self._n_threads) as pool:
+                permanents = list(pool.map(self._permanent, matching))
+        else:
+            permanents = [self._permanent(output_state) for output_state in matching]
+        result = np.zeros(len(output_states), dtype=complex)
+        result[[i for i, output_state in enumerate(output_states) if output_state.n == n]] = \
+            np.array(permanents, dtype=complex) / norms
+        return result
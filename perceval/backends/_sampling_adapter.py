@@ -0,0 +1,126 @@
+# MIT License
+#
+# Copyright (c) 2022 Quandela
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# As a special exception, the copyright holders of exqalibur library give you
+# permission to combine exqalibur with code included in the standard release of
+# Perceval under the MIT license (or modified versions of such code). You may
+# copy and distribute such a combined system following the terms of the MIT
+# license for both exqalibur and Perceval. This exception for the usage of
+# exqalibur is limited to the python bindings used by Perceval.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from typing import List, Tuple, Union
+
+import numpy as np
+
+from perceval.components import ACircuit
+from perceval.utils import BasicState, BSSamples, LRUCache
+from ._abstract_backends import AProbAmpliBackend, ASamplingBackend
+
+
+def _alias_table(probs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Vose's alias table of a discrete distribution: drawing a uniform index i, then keeping it with probability
+    threshold[i] or else taking alias[i], samples the distribution in O(1)"""
+    size = len(probs)
+    scaled = probs * size / probs.sum()
+    threshold = np.ones(size)
+    alias = np.arange(size)
+    small = [i for i in range(size) if scaled[i] < 1]
+    large = [i for i in range(size) if scaled[i] >= 1]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        threshold[s] = scaled[s]
+        alias[s] = l
+        scaled[l] -= 1 - scaled[s]
+        (small if scaled[l] < 1 else large).append(l)
+    # Remaining entries have a scaled probability of 1, up to rounding errors
+    return threshold, alias
+
+
+def _table_nbytes(table: Tuple[List[BasicState], np.ndarray, np.ndarray]) -> int:
+    """Approximate memory footprint of an alias table: a reference and an occupation per mode for each of its states
+    (as in the result cache of a Simulator), along with the threshold and alias arrays"""
+    states, threshold, alias = table
+    m = states[0].m if states else 0
+    return len(states) * (8 + 8 * m) + threshold.nbytes + alias.nbytes
+
+
+class SamplingAdapter(ASamplingBackend):
+    """Sampling backend drawing samples from the output distribution computed by a probability amplitude backend.
+
+    The output distribution of each input state is computed once and turned into an alias table, so that each
+    sample is then drawn in constant time. Tables are kept until the circuit unitary changes, in a least recently used
+    cache bounded by `cache_size` bytes.
+
+    :param backend: the probability amplitude backend (or its name) computing the output distributions
+    :param cache_size: maximum size of the alias tables cache, in bytes (default 256 MB)
+    """
+
+    def __init__(self, backend: Union[AProbAmpliBackend, str] = "SLOS", cache_size: int = 1 << 28):
+        super().__init__()
+        if isinstance(backend, str):
+            from . import BACKEND_LIST
+            assert backend in BACKEND_LIST, f"Simulation backend '{backend}' does not exist"
+            backend = BACKEND_LIST[backend]()
+        assert isinstance(backend, AProbAmpliBackend), "SamplingAdapter requires a probability amplitude backend"
+        self._backend = backend
+        self._tables = LRUCache(cache_size, sizeof=_table_nbytes)
+        self._backend_circuit = None  # Circuit currently set in the wrapped backend
+
+    @property
+    def name(self) -> str:
+        return f"SamplingAdapter({self._backend.name})"
+
+    @property
+    def backend(self) -> AProbAmpliBackend:
+        return self._backend
+
+    def set_circuit(self, circuit: ACircuit):
+        previous_umat = self._umat
+        super().set_circuit(circuit)
+        if previous_umat is None or previous_umat.shape != self._umat.shape \
+                or not np.array_equal(np.asarray(previous_umat), np.asarray(self._umat)):
+            self._tables.clear()
+            self._backend_circuit = None
+
+    def _table(self) -> Tuple[List[BasicState], np.ndarray, np.ndarray]:
+        key = tuple(self._input_state)
+        table = self._tables.get(key)
+        if table is None:
+            if self._backend_circuit is not self._circuit:
+                self._backend.set_circuit(self._circuit)
+                self._backend_circuit = self._circuit
+            self._backend.set_input_state(self._input_state)
+            distribution = self._backend.prob_distribution()
+            states = list(distribution.keys())
+            threshold, alias = _alias_table(np.array(list(distribution.values()), dtype=float))
+            table = (states, threshold, alias)
+            self._tables.put(key, table)
+        return table
+
+    def sample(self) -> BasicState:
+        return self.samples(1)[0]
+
+    def samples(self, count: int) -> BSSamples:
+        states, threshold, alias = self._table()
+        indexes = np.random.randint(len(states), size=count)
+        indexes = np.where(np.random.random(count) < threshold[indexes], indexes, alias[indexes])
+        return BSSamples(states[i] for i in indexes.tolist())
@@ -28,14 +28,111 @@
 # SOFTWARE.
 
 from ._abstract_backends import AProbAmpliBackend
-from perceval.utils import allstate_iterator, Matrix, BasicState, BSDistribution, StateVector
+from ._fsm_cache import FSMapCache
+from perceval.components import ACircuit
+from perceval.utils import allstate_iterator, Matrix, BasicState, BSDistribution, FSDistribution, StateVector, \
+    global_params
 
+from concurrent.futures import ThreadPoolExecutor
 import exqalibur as xq
 import math
 import numpy as np
+import tempfile
 from typing import Dict, List
 
 
+_FSMAP_ENTRY_SIZE = 8  # Approximate memory footprint of an entry of an exqalibur FSMap, in bytes
+_TABLE_ENTRY_SIZE = 72  # Approximate peak memory used per entry by fock_space_map_table (with its temporaries)
+
+
+def _state_counts(m: int, n: int) -> np.ndarray:
+    """counts[q, p] is the number of Fock states of q photons in p modes, for q <= n and p <= m"""
+    return np.array([[math.comb(q + p - 1, q) if p else int(q == 0) for p in range(m + 1)] for q in range(n + 1)],
+                    dtype=np.int64)
+
+
+def _fock_states(m: int, n: int, start: int = 0, stop: int = None) -> np.ndarray:
+    """The Fock states of n photons in m modes ranked from `start` to `stop` (default: all of them), as a (count, m)
+    array following the order of an exqalibur FSArray (i.e. decreasing lexicographic order).
+
+    States are unranked independently from each other: in this order, the states with t photons left after mode i
+    come in blocks of increasing t, so that the cumulated block sizes (counts[t, m - i]) give the occupation of mode i
+    by a binary search.
+    """
+    counts = _state_counts(m, n)
+    ranks = np.arange(start, counts[n, m] if stop is None else stop, dtype=np.int64)
+    states = np.empty((len(ranks), m), dtype=np.int64)
+    remaining = np.full(len(ranks), n, dtype=np.int64)
+    for i in range(m - 1):
+        cumulated = counts[:, m - i]
+        left = np.searchsorted(cumulated, ranks, side='right')  # Photon count left after mode i
+        ranks = ranks - np.where(left > 0, cumulated[np.maximum(left - 1, 0)], 0)
+        states[:, i] = remaining - left
+        remaining = left
+    states[:, m - 1] = remaining
+    return states
+
+
+def _click_patterns(m: int, n: int) -> np.ndarray:
+    """Threshold detection pattern of all the Fock states of n photons in m modes, as bit masks (bit i is set when
+    mode i holds at least one photon), following the order of an exqalibur FSArray"""
+    memo = {}
+
+    def patterns(modes: int, photons: int) -> np.ndarray:
+        if (modes, photons) not in memo:
+            if modes == 1:
+                memo[modes, photons] = np.array([int(photons > 0) << (m - 1)], dtype=np.int64)
+            else:
+                memo[modes, photons] = np.concatenate([patterns(modes - 1, photons - v) | (int(v > 0) << (m - modes))
+                                                       for v in range(photons, -1, -1)])
+        return memo[modes, photons]
+    return patterns(m, n)
+
+
+def fock_space_map_table(m: int, k: int, start: int = 0, stop: int = None) -> np.ndarray:
+    """Index table of the unmasked Fock space map from k-1 to k photons in m modes: table[i, j] is the index, in an
+    exqalibur FSArray of k photons, of the state obtained by adding a photon in mode j to the state of index i in a
+    FSArray of k-1 photons. Only the parent states ranked from `start` to `stop` (default: all of them) are mapped.
+
+    The index of a state in a FSArray is its rank in decreasing lexicographic order, i.e. the sum over modes i of the
+    number of states having the same occupations before i, and more photons in i. Adding a photon in mode j shifts
+    the rank terms of all modes before j, which gives the whole table from the parent states in a vectorized way.
+    """
+    parents = _fock_states(m, k - 1, start, stop)
+    # binom[q + p - 1, p - 1] is the number of Fock states of q photons in p modes
+    binom = np.array([[math.comb(a, b) for b in range(m + 1)] for a in range(k + m + 1)], dtype=np.int64)
+    remaining = k - 1 - np.cumsum(parents, axis=1) + parents  # Photon count left before reaching each mode
+    q = remaining - parents - 1
+    p = m - np.arange(m)
+
+    def count_states(photons):
+        return np.where(photons >= 0, binom[np.maximum(photons, 0) + p - 1, p - 1], 0)
+
+    shifted = np.cumsum(count_states(q + 1), axis=1) - count_states(q + 1)  # Terms of modes before j, shifted
+    unchanged = np.cumsum(count_states(q)[:, ::-1], axis=1)[:, ::-1]  # Terms of modes from j, unchanged
+    return shifted + unchanged
+
+
+def _compute_slos_layer(table: np.ndarray, u_col: np.ndarray, coefs: np.ndarray, parent_coefs: np.ndarray,
+                        chunk_size: int = None):
+    """Numpy counterpart of FSMap.compute_slos_layer, working on a stack of coefficient vectors
+
+    :param table: the Fock space map index table (see `SLOSBackend._fsm_table`)
+    :param u_col: (K, m) unitary matrix columns corresponding to the mode of the added photon
+    :param coefs: (K, N) output coefficients, updated in place
+    :param parent_coefs: (K, P) coefficients of the parent layer
+    :param chunk_size: (Optional) number of parent states processed at once, bounding the size of temporary arrays
+    """
+    parent_count = table.shape[0]
+    chunk_size = chunk_size or parent_count
+    for start in range(0, parent_count, chunk_size):
+        end = min(start + chunk_size, parent_count)
+        for j in range(table.shape[1]):
+            targets = table[start:end, j]
+            parent_idx = np.nonzero(targets >= 0)[0]
+            coefs[:, targets[parent_idx]] += parent_coefs[:, start + parent_idx] * u_col[:, j, np.newaxis]
+
+
 class _Path:
     """A `Path` is the minimal computing graph for covering a set of input states"""
 
@@ -43,7 +140,10 @@ class _Path:
         self._n = n
         self._m = m
         self._backend = backend
-        self.coefs = Matrix.zeros((backend._mk_l[n], 1), use_symbolic=self._backend._symb)
+        if backend._symb or backend._dtype == np.complex128:
+            self.coefs = Matrix.zeros((backend._mk_l[n], 1), use_symbolic=self._backend._symb)
+        else:
+            self.coefs = np.zeros((backend._mk_l[n], 1), dtype=backend._dtype)
         if n == 0:
             self.coefs.fill(1)
 
@@ -87,54 +187,140 @@ class _Path:
             targets = new_targets
             states = new_states
 
+    def compute_layer(self, u, parent_coefs: Matrix, mk: int):
+        r"""Update the coefficients of this path only, given its parent's coefficients"""
+        if self._backend._symb:
+            self.coefs.fill(0)
+            for parent_idx, coef_parent in enumerate(parent_coefs):
+                for j in range(self._m):
+                    idx = self._backend._fsms[self._n].get(parent_idx, j)
+                    if idx != xq.npos:
+                        self.coefs[idx] += coef_parent * u[j, mk]
+        elif self._backend._fsms[self._n] is None or self.coefs.dtype != np.complex128:
+            # The Fock space map is not available as an exqalibur FSMap, or the precision is not supported by exqalibur
+            self.coefs.fill(0)
+            u_col = np.asarray(u, dtype=self.coefs.dtype)[np.newaxis, :, mk]
+            backend = self._backend
+            # An index table is used when loaded from a cache, or when it can be built from the masked Fock space map
+            table = backend._fsm_table(self._n) \
+                if self._n in backend._fsm_tables or backend._fsms[self._n] is not None else None
+            backend._compute_numpy_layer(self._n, u_col, self.coefs.T, parent_coefs.T, table)
+        else:
+            self._backend._fsms[self._n].compute_slos_layer(u, self._m, mk, self.coefs, parent_coefs)
+
     def compute(self, u, parent_coefs: Matrix = None, mk: int = None):
         r"""Given the precompiled compute path, update all the coefficients"""
         if parent_coefs is not None:
-            if self._backend._symb:
-                self.coefs.fill(0)
-                for parent_idx, coef_parent in enumerate(parent_coefs):
-                    for j in range(self._m):
-                        idx = self._backend._fsms[self._n].get(parent_idx, j)
-                        if idx != xq.npos:
-                            self.coefs[idx] += coef_parent * u[j, mk]
-            else:
-                self._backend._fsms[self._n].compute_slos_layer(u, self._m, mk, self.coefs, parent_coefs)
+            self.compute_layer(u, parent_coefs, mk)
 
         for mk, child in self._children.items():
             child.compute(u, self.coefs, mk)
 
 
 class SLOSBackend(AProbAmpliBackend):
-    def __init__(self, mask=None, n=None, use_symbolic=False):
+    """Strong Linear Optical Simulation backend
+
+    :param mask: (Optional) a mask restricting the output states to compute
+    :param n: photon count, required when using a mask
+    :param use_symbolic: compute symbolic probability amplitudes
+    :param n_threads: (Optional) number of threads used to compute independent paths in parallel. Sibling paths only
+        read their parent coefficients, so that they can be computed concurrently. Default is a serial computation.
+    :param low_memory: if True, only the current input state is computed and every intermediate layer (Fock space
+        map and coefficients) is freed as soon as the next one is computed. This trades the reuse of previous
+        computations for a lower peak memory usage.
+    :param fsm_cache: (Optional) a persistent cache of Fock space maps. When set, Fock space maps are loaded from (or
+        stored to) the cache as index tables instead of being rebuilt by each backend instance.
+    :param dtype: numeric type of the probability amplitudes, either numpy.complex128 (default) or numpy.complex64.
+        Single precision halves the size of the coefficient vectors, at the cost of a ~1e-7 relative precision on the
+        results. Layers are then computed by a numpy kernel which builds the Fock space maps by chunks instead of
+        keeping them in memory (unless a mask or a Fock space map cache is used), which is slower.
+    :param disk_threshold: (Optional) size (in bytes) above which a coefficient vector is stored in a memory-mapped
+        file instead of RAM, so that state spaces larger than the available memory can be computed. Implies
+        `low_memory`. Layers are then computed by the numpy kernel whatever the dtype, which builds the Fock space maps
+        by chunks bounded by the threshold (except with a mask, whose maps are held in RAM), and the output
+        probabilities of such layers are streamed to disk by chunks as well. The Fock states of the output layer are
+        only generated in RAM when looked up (e.g. by `probability` or `fs_distribution`).
+    :param scratch_dir: (Optional) directory where the memory-mapped files are created. Default is the system
+        temporary directory. Files are anonymous and removed as soon as they are not used anymore.
+    """
+
+    DISK_CHUNK_SIZE = 1 << 22  # Number of elements processed at once when working on memory-mapped arrays
+    FSM_CHUNK_SIZE = 1 << 12  # Minimal number of Fock space map entries built at once by the numpy kernel
+
+    def __init__(self, mask=None, n=None, use_symbolic=False, n_threads: int = None, low_memory: bool = False,
+                 fsm_cache: FSMapCache = None, dtype=np.complex128, disk_threshold: int = None,
+                 scratch_dir: str = None):
         super().__init__()
         self._reset()
         self._symb = use_symbolic
         self._mask_str = mask
         self._n = n
         self._mask = None
+        assert n_threads is None or n_threads > 0, "Thread count must be a positive integer"
+        self._n_threads = n_threads
+        assert not ((low_memory or disk_threshold is not None) and use_symbolic), \
+            "Low memory mode is not available in symbolic mode"
+        self._low_memory = low_memory or disk_threshold is not None
+        self._disk_threshold = disk_threshold
+        self._scratch_dir = scratch_dir
+        self._peak_memory = 0
+        assert not (fsm_cache and use_symbolic), "Fock space map cache is not available in symbolic mode"
+        self._fsm_cache = fsm_cache
+        self._dtype = np.dtype(dtype)
+        assert self._dtype in (np.complex64, np.complex128), "Amplitude type must be numpy.complex64 or complex128"
+        assert not (use_symbolic and self._dtype != np.complex128), "Symbolic computation cannot use a numeric type"
 
     @property
     def name(self) -> str:
         return "SLOS"
 
+    @classmethod
+    def estimate_cost(cls, circuit: ACircuit, input_state: BasicState, output_count: int = None):
+        # The whole output distribution is computed whatever the requested outputs. Layer k holds the
+        # C(m+k-1, k) coefficients of k photons, each computed from its parents through m Fock space map entries
+        m = circuit.m
+        parent_count = sum(math.comb(m + k - 2, k - 1) for k in range(1, input_state.n + 1))
+        coef_count = sum(math.comb(m + k - 1, k) for k in range(input_state.n + 1))
+        return {"time": 1e-7 * m * parent_count,
+                "memory": 16 * coef_count + 4 * m * parent_count}
+
     def _reset(self):
+        self._map_peak_memory = 0  # Peak size of the Fock space map chunks built by the numpy kernel
         self._fsms = [[]]
         self._fsas = {}
         self._mk_l: List[int] = [1]
+        self._fsm_tables: Dict[int, np.ndarray] = {}
         self._path_roots: List[_Path] = []
         self._state_mapping: Dict[BasicState, _Path] = {}
         self._mask = None
+        self._low_memory_state = None
+        self._low_memory_coefs = None
 
     def _compute_path(self, umat):
         for path in self._path_roots:
-            path.compute(umat)
+            self._compute_tree(path, umat)
+
+    def _compute_tree(self, root: _Path, umat):
+        if self._symb or not self._n_threads or self._n_threads == 1:
+            root.compute(umat)
+            return
+        # Layer by layer traversal: all the paths of a given layer are independent from each other
+        frontier = [(child, root, mk) for mk, child in root._children.items()]
+        with ThreadPoolExecutor(max_workers=self._n_threads) as pool:
+            while frontier:
+                list(pool.map(lambda task: task[0].compute_layer(umat, task[1].coefs, task[2]), frontier))
+                frontier = [(child, path, mk) for path, _, _ in frontier for mk, child in path._children.items()]
 
     def set_circuit(self, circuit):
         previous_circuit = self._circuit
         assert not circuit.requires_polarization, "Circuit must not contain polarized components"
         self._input_state = None
         self._circuit = circuit
+        previous_umat = self._umat
         self._umat = circuit.compute_unitary(use_symbolic=self._symb)
+        if previous_circuit is not None and previous_circuit.m == circuit.m and not self._symb \
+                and np.array_equal(previous_umat, self._umat):
+            return  # Same unitary matrix, all the computed coefficients are still valid
         if self._path_roots and previous_circuit.m == circuit.m:
             # Use the previously deployed paths to store the new circuit's coefs
             self._compute_path(self._umat)
@@ -144,10 +330,85 @@ class SLOSBackend(AProbAmpliBackend):
                 assert self._n is not None, "Photon count (n) is required when using a mask"
                 self._mask = xq.FSMask(circuit.m, self._n, self._mask_str)
 
+    @property
+    def peak_memory(self) -> int:
+        """Peak size (in bytes) of the coefficient vectors and Fock space maps simultaneously held by the backend in
+        RAM. The size of exqalibur Fock space maps is estimated."""
+        if self._low_memory:
+            return self._peak_memory
+
+        def path_size(path: _Path) -> int:
+            return path.coefs.nbytes + sum(path_size(child) for child in path._children.values())
+        m = self._circuit.m if self._circuit is not None else 0
+        maps = sum(self._mk_l[k - 1] * m * _FSMAP_ENTRY_SIZE for k in range(1, len(self._fsms))
+                   if self._fsms[k] is not None)
+        tables = sum(self._ram_size(table) for table in self._fsm_tables.values())
+        return sum(path_size(root) for root in self._path_roots) + maps + tables + self._map_peak_memory
+
     def set_input_state(self, input_state: BasicState):
-        self.preprocess([input_state])
+        if self._low_memory:
+            self._check_state(input_state)
+            self._compute_low_memory(input_state)
+        else:
+            self.preprocess([input_state])
         super().set_input_state(input_state)
 
+    def _compute_low_memory(self, input_state: BasicState):
+        if self._low_memory_state is not None and input_state == self._low_memory_state:
+            return
+        # Free the previous result before computing the new one
+        self._low_memory_state = None
+        self._low_memory_coefs = None
+        self._fsas = {}
+        m = self._circuit.m
+        # Out-of-core layers are computed by the numpy kernel, so that no Fock space map is held entirely in RAM
+        use_numpy = self._dtype != np.complex128 or self._disk_threshold is not None
+        fsa = xq.FSArray(m, 0, self._mask) if self._mask else xq.FSArray(m, 0)
+        coefs = np.ones((1, 1), dtype=self._dtype)
+        self._peak_memory = coefs.nbytes
+        k = 0
+        for mk in range(m):
+            for _ in range(input_state[mk]):
+                k += 1
+                fsa_parent = fsa
+                # FSArrays are lazy: states are only generated when looked up, which the unmasked kernel never does
+                fsa = xq.FSArray(m, k, self._mask) if self._mask else xq.FSArray(m, k)
+                layer = self._allocate((fsa.count(), 1), self._dtype)
+                if not use_numpy:
+                    fsm = xq.FSMap(fsa, fsa_parent, True)
+                    fsm.compute_slos_layer(self._umat, m, mk, layer, coefs)
+                    map_size = fsa_parent.count() * m * _FSMAP_ENTRY_SIZE
+                else:
+                    table = None
+                    if self._mask:
+                        table = self._build_fsm_table(k, xq.FSMap(fsa, fsa_parent, True), fsa_parent.count(),
+                                                      fsa.count())
+                    u_col = np.asarray(self._umat, dtype=self._dtype)[np.newaxis, :, mk]
+                    map_size = self._compute_numpy_layer(k, u_col, layer.T, coefs.T, table)
+                self._peak_memory = max(self._peak_memory,
+                                        self._ram_size(coefs) + self._ram_size(layer) + map_size)
+                coefs = layer  # Layer k-1 and its Fock space map are released here
+        self._fsas[input_state.n] = fsa
+        self._low_memory_state = input_state
+        self._low_memory_coefs = coefs
+
+    def _allocate(self, shape: tuple, dtype) -> np.ndarray:
+        """Allocate a zero-filled array, backed by an anonymous memory-mapped file when it exceeds the disk threshold"""
+        if self._disk_threshold is None or math.prod(shape) * np.dtype(dtype).itemsize <= self._disk_threshold:
+            return np.zeros(shape, dtype=dtype)
+        # The file is deleted when closed, but stays reachable through the mapping until the array is released
+        with tempfile.TemporaryFile(dir=self._scratch_dir) as f:
+            return np.memmap(f, dtype=dtype, mode='w+', shape=shape)
+
+    @staticmethod
+    def _ram_size(array: np.ndarray) -> int:
+        return 0 if isinstance(array, np.memmap) else array.nbytes
+
+    def _coefs(self, input_state: BasicState):
+        if self._low_memory:
+            return self._low_memory_coefs
+        return self._state_mapping[input_state].coefs
+
     def _deploy(self, input_list: List[BasicState]):
         # allocate the fsas and fsms for covering all the input_states respecting possible mask
         # after calculation, we only need to keep fsa for input_state n
@@ -163,7 +424,13 @@ class SLOSBackend(AProbAmpliBackend):
                 fsa_n_m1 = current_fsa
                 current_fsa = xq.FSArray(m, k, self._mask) if self._mask else xq.FSArray(m, k)
                 self._mk_l.append(current_fsa.count())
-                self._fsms.append(xq.FSMap(current_fsa, fsa_n_m1, True))
+                if self._fsm_cache is None and self._dtype != np.complex128 and self._mask is None:
+                    self._fsms.append(None)  # The numpy kernel builds the Fock space map by chunks
+                elif self._fsm_cache is None:
+                    self._fsms.append(xq.FSMap(current_fsa, fsa_n_m1, True))
+                else:
+                    self._fsms.append(None)
+                    self._load_fsm_table(k, current_fsa, fsa_n_m1)
             if n not in self._fsas:
                 self._fsas[n] = current_fsa
 
@@ -179,7 +446,7 @@ class SLOSBackend(AProbAmpliBackend):
 
         self._deploy(input_list)  # build the necessary fsa/fsms
         new_path = _Path(0, self._circuit.m, input_list, None, self)
-        new_path.compute(self._umat)
+        self._compute_tree(new_path, self._umat)
         self._path_roots.append(new_path)
         return True
 
@@ -188,30 +455,188 @@ class SLOSBackend(AProbAmpliBackend):
             return complex(0)
         output_idx = self._fsas[output_state.n].find(output_state)
         assert output_idx != xq.npos
-        result = self._state_mapping[self._input_state].coefs[output_idx, 0] * math.sqrt(output_state.prodnfact() / self._input_state.prodnfact())
+        result = self._coefs(self._input_state)[output_idx, 0] \
+            * math.sqrt(output_state.prodnfact() / self._input_state.prodnfact())
         return result if self._symb else complex(result)
 
+    def fs_distribution(self) -> FSDistribution:
+        """SLOS specific signature, returning the output distribution as a probability array indexed by Fock states.
+        Contrary to `prob_distribution`, no output state is instantiated."""
+        istate = self._input_state
+        return FSDistribution(self._fsas[istate.n], self.all_prob(istate))
+
     def prob_distribution(self) -> BSDistribution:
+        return self.fs_distribution().to_bsd()
+
+    def marginal_distribution(self, modes: List[int]) -> BSDistribution:
+        """Photon count distribution on a subset of the output modes (see `AProbAmpliBackend.marginal_distribution`)
+
+        With a mask, the marginals are traced out from the masked output distribution.
+        """
+        assert not self._symb, "Marginal distributions are not available in symbolic mode"
+        if self._mask is None:
+            return super().marginal_distribution(modes)
+        return self._traced_out_distribution(self._check_modes(modes))
+
+    def threshold_prob_distribution(self) -> BSDistribution:
+        """Click pattern distribution of threshold detectors (see `AProbAmpliBackend.threshold_prob_distribution`)
+
+        SLOS computes the whole output distribution at once, which is then directly collapsed on click patterns in
+        array form: this is faster than the generic subset algorithm, and no bunched output state is instantiated.
+        With a mask, the masked output distribution is collapsed on click patterns.
+        """
+        assert not self._symb, "Threshold detection is not available in symbolic mode"
+        m = self._circuit.m
+        if self._mask is not None:
+            return self._collapsed_click_patterns()
+        if m > 62:
+            return super().threshold_prob_distribution()
         istate = self._input_state
-        c = np.copy(self._state_mapping[istate].coefs).reshape(self._fsas[istate.n].count())
-        c = abs(c) ** 2 / istate.prodnfact()
-        xq.all_prob_normalize_output(c, self._fsas[istate.n])
+        patterns, inverse = np.unique(_click_patterns(m, istate.n), return_inverse=True)
+        probs = np.bincount(inverse, weights=self.all_prob(istate), minlength=len(patterns))
         bsd = BSDistribution()
-        for output_state, probability in zip(allstate_iterator(self._input_state, self._mask), c):
-            bsd.add(output_state, probability)
+        for pattern, prob in zip(patterns.tolist(), probs.tolist()):
+            if prob > global_params['min_p']:
+                bsd.add(BasicState([(pattern >> mode) & 1 for mode in range(m)]), prob)
         return bsd
 
-    def all_prob(self, input_state: BasicState):
-        """SLOS specific signature, to enhance optimization in some computations"""
+    def all_prob(self, input_state: BasicState, output_file: str = None):
+        """SLOS specific signature, to enhance optimization in some computations
+
+        :param input_state: the input state
+        :param output_file: (Optional) path of a .npy file where the probabilities are streamed by chunks. The
+            returned array is then memory-mapped to this file. Probabilities of layers stored on disk (see
+            `disk_threshold`) are always streamed to disk.
+        """
         self.set_input_state(input_state)
-        c = np.copy(self._state_mapping[input_state].coefs).reshape(self._fsas[input_state.n].count())
-        c = abs(c)**2 / self._input_state.prodnfact()
-        xq.all_prob_normalize_output(c, self._fsas[input_state.n])
+        coefs = self._coefs(input_state)
+        if output_file is None and not isinstance(coefs, np.memmap):
+            c = np.copy(coefs).reshape(self._fsas[input_state.n].count())
+            c = abs(c)**2 / self._input_state.prodnfact()
+            if c.dtype == np.float64:
+                xq.all_prob_normalize_output(c, self._fsas[input_state.n])
+            else:
+                c *= self._output_norm(input_state.n).astype(c.dtype)
+            return c
+        return self._stream_prob(input_state, coefs.reshape(-1), output_file)
+
+    def _stream_prob(self, input_state: BasicState, coefs: np.ndarray, output_file: str = None) -> np.ndarray:
+        count = len(coefs)
+        dtype = coefs.real.dtype
+        if output_file is None:
+            c = self._allocate((count,), dtype)
+        else:
+            c = np.lib.format.open_memmap(output_file, mode='w+', dtype=dtype, shape=(count,))
+        prodnfact = input_state.prodnfact()
+        m = self._circuit.m
+        factorials = np.array([math.factorial(q) for q in range(input_state.n + 1)], dtype=np.float64)
+        chunk = max(1, self.DISK_CHUNK_SIZE // m)  # Bounds the (chunk, m) array of unranked states
+        for start in range(0, count, chunk):
+            c[start:start + chunk] = abs(coefs[start:start + chunk]) ** 2 / prodnfact
+            if self._mask is None:
+                # Output normalization from the unranked states, so that the output FSArray is never generated
+                states = _fock_states(m, input_state.n, start, min(start + chunk, count))
+                c[start:start + chunk] *= factorials[states].prod(axis=1).astype(dtype)
+        if self._mask is not None:
+            norm = self._allocate((count,), np.float64)
+            for start in range(0, count, chunk):
+                norm[start:start + chunk] = 1
+            xq.all_prob_normalize_output(norm, self._fsas[input_state.n])
+            for start in range(0, count, chunk):
+                c[start:start + chunk] *= norm[start:start + chunk]
+        if isinstance(c, np.memmap):
+            c.flush()
         return c
 
+    def _compute_numpy_layer(self, k: int, u_col: np.ndarray, coefs: np.ndarray, parent_coefs: np.ndarray,
+                             table: np.ndarray = None) -> int:
+        """Computes the k-th layer with the numpy kernel (see `_compute_slos_layer`)
+
+        When no index table of the Fock space map is given, the map is built by chunks of parent states: it is then
+        never held entirely in memory, each chunk being about the size of the layer coefficients, or of the disk
+        threshold for a memory-mapped layer (and at least FSM_CHUNK_SIZE entries).
+
+        :return: the peak size (in bytes) of the Fock space map data built for this layer
+        """
+        m = self._circuit.m
+        if table is not None:
+            _compute_slos_layer(table, u_col, coefs, parent_coefs,
+                                self.DISK_CHUNK_SIZE if isinstance(coefs, np.memmap) else None)
+            return self._ram_size(table)
+        parent_count = parent_coefs.shape[1]
+        # Chunks of an out-of-core layer are bounded by the disk threshold instead of the size of the layer
+        budget = self._disk_threshold if isinstance(coefs, np.memmap) else coefs.nbytes
+        chunk_size = min(parent_count, max(self.FSM_CHUNK_SIZE // m,
+                                           min(budget // (_TABLE_ENTRY_SIZE * m), self.DISK_CHUNK_SIZE // m)))
+        for start in range(0, parent_count, chunk_size):
+            stop = min(start + chunk_size, parent_count)
+            _compute_slos_layer(fock_space_map_table(m, k, start, stop), u_col, coefs, parent_coefs[:, start:stop])
+        map_size = chunk_size * m * _TABLE_ENTRY_SIZE
+        self._map_peak_memory = max(self._map_peak_memory, map_size)
+        return map_size
+
+    def _fsm_table(self, k: int) -> np.ndarray:
+        """Index table of the k-th Fock space map: table[parent_idx, mode] is the index of the state obtained when
+        adding a photon in `mode` to the parent state (or -1 if this state is masked out)"""
+        if k not in self._fsm_tables:
+            self._fsm_tables[k] = self._build_fsm_table(k, self._fsms[k], self._mk_l[k - 1], self._mk_l[k])
+        return self._fsm_tables[k]
+
+    def _build_fsm_table(self, k: int, fsm: xq.FSMap, parent_count: int, count: int) -> np.ndarray:
+        m = self._circuit.m
+        dtype = np.int32 if count < np.iinfo(np.int32).max else np.int64
+        if self._mask is None:
+            return fock_space_map_table(m, k).astype(dtype)
+        table = np.array([[fsm.get(parent_idx, j) for j in range(m)] for parent_idx in range(parent_count)],
+                         dtype=np.int64).reshape(-1, m)
+        table[table == xq.npos] = -1
+        return table.astype(dtype)
+
+    def _load_fsm_table(self, k: int, fsa: xq.FSArray, fsa_parent: xq.FSArray):
+        m = self._circuit.m
+        mask_key = None if self._mask_str is None else [str(self._n)] + list(self._mask_str)
+        table = self._fsm_cache.get(m, k, mask_key)
+        if table is None:
+            fsm = xq.FSMap(fsa, fsa_parent, True) if self._mask is not None else None
+            table = self._fsm_cache.put(m, k, mask_key, self._build_fsm_table(k, fsm, fsa_parent.count(), fsa.count()))
+        self._fsm_tables[k] = table
+
+    def _output_norm(self, n: int) -> np.ndarray:
+        norm = np.ones(self._fsas[n].count())
+        xq.all_prob_normalize_output(norm, self._fsas[n])
+        return norm
+
+    def all_prob_batch(self, input_state: BasicState, unitaries: np.ndarray) -> np.ndarray:
+        """SLOS specific signature, computing all output probabilities for a stack of unitary matrices at once
+
+        All unitaries have to share the size of the circuit set in the backend. This is typically useful to sweep
+        parameters of a given circuit topology.
+
+        :param input_state: the input state (without annotations)
+        :param unitaries: a (k, m, m) array of unitary matrices
+        :return: a (k, N_out) array of probabilities, where the output states are ordered as in `all_prob`
+        """
+        assert not self._symb, "Batched computation is not available in symbolic mode"
+        unitaries = np.asarray(unitaries, dtype=self._dtype)
+        m = self._circuit.m
+        assert unitaries.ndim == 3 and unitaries.shape[1:] == (m, m), \
+            f"Expected a stack of {m}x{m} unitary matrices (got shape {unitaries.shape})"
+        self._check_state(input_state)
+        self._deploy([input_state])
+
+        coefs = np.ones((unitaries.shape[0], 1), dtype=self._dtype)
+        k = 0
+        for mk in range(m):
+            for _ in range(input_state[mk]):
+                k += 1
+                layer = np.zeros((unitaries.shape[0], self._mk_l[k]), dtype=self._dtype)
+                _compute_slos_layer(self._fsm_table(k), unitaries[:, :, mk], layer, coefs)
+                coefs = layer
+        return abs(coefs) ** 2 * (self._output_norm(input_state.n) / input_state.prodnfact()).astype(coefs.real.dtype)
+
     def evolve(self) -> StateVector:
         istate = self._input_state
-        c = np.copy(self._state_mapping[istate].coefs).reshape(self._fsas[istate.n].count())
+        c = np.copy(self._coefs(istate)).reshape(self._fsas[istate.n].count())
         res = StateVector()
         iprodnfact = istate.prodnfact()
         for output_state, pa in zip(allstate_iterator(self._input_state, self._mask), c):
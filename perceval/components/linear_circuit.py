@@ -279,6 +279,104 @@ class ACircuit(AParametrizedComponent, ABC):
         pass
 
 
+class _IncrementalUnitary:
+    """Numeric unitary of a circuit, along with checkpoints of the prefix and suffix partial products of its components
+
+    When a few components change (typically phase shifters in a variational loop), the circuit unitary is updated with
+    the partial products around each changed component instead of being recomputed from scratch. These are obtained
+    from the closest checkpoint: at most MAX_CHECKPOINTS prefix and suffix products are kept, so that the memory
+    footprint stays bounded by 2 * MAX_CHECKPOINTS m x m matrices whatever the number of components. Checkpoints are
+    only built by the first update, and invalidated checkpoints are lazily recomputed when a later update requires them.
+    """
+    REFRESH_PERIOD = 1000  # Number of incremental updates after which the unitary is recomputed to avoid any drift
+    MAX_CHECKPOINTS = 16  # Maximum number of stored prefix (resp. suffix) products
+
+    def __init__(self, m: int, components: list):
+        self._m = m
+        self._components = [(tuple(r), c) for r, c in components]
+        self._keys = [self._component_key(c) for _, c in components]
+        self._blocks = [self._component_unitary(c) for _, c in components]
+        n = len(components)
+        self._stride = max(1, -(-n // self.MAX_CHECKPOINTS))  # Number of components between two checkpoints
+        self._prefix = {}  # _prefix[i]: product of the first i components, for i a positive multiple of the stride
+        self._suffix = {}  # _suffix[i]: product of the components from i, for i a multiple of the stride below n
+        self._prefix_valid = 0  # Stored prefix checkpoints up to this index are valid
+        self._suffix_valid = n  # Stored suffix checkpoints from this index are valid
+        self.unitary = self._prefix_product(n, store=False)
+        self._update_count = 0
+
+    def __deepcopy__(self, memo):
+        return None  # Partial products are cheaper to recompute than to copy
+
+    @staticmethod
+    def _component_key(component: ACircuit) -> Optional[tuple]:
+        """Parameter values of an elementary component, which fully define its unitary matrix. None if the unitary
+        matrix has to be computed to know whether it changed."""
+        if component.is_composite() or any(p._is_expression for p in component._params.values()):
+            return None
+        return tuple(p._value for p in component._params.values())
+
+    @staticmethod
+    def _component_unitary(component: ACircuit) -> np.ndarray:
+        return np.asarray(component.compute_unitary(use_symbolic=False, use_polarization=False), dtype=complex)
+
+    def matches(self, components: list) -> bool:
+        return len(components) == len(self._components) and \
+            all(tuple(r) == cr and c is cc for (r, c), (cr, cc) in zip(components, self._components))
+
+    def _prefix_product(self, i: int, store: bool = True) -> np.ndarray:
+        """Product of the first i components, from the closest valid checkpoint (storing the checkpoints passed)"""
+        start = min(i, self._prefix_valid) // self._stride * self._stride
+        u = self._prefix[start].copy() if start else np.eye(self._m, dtype=complex)
+        for j in range(start, i):
+            r = self._components[j][0]
+            u[r[0]:r[-1] + 1, :] = self._blocks[j] @ u[r[0]:r[-1] + 1, :]
+            if store and (j + 1) % self._stride == 0:
+                self._prefix[j + 1] = u.copy()
+        if store:
+            self._prefix_valid = max(self._prefix_valid, i // self._stride * self._stride)
+        return u
+
+    def _suffix_product(self, i: int) -> np.ndarray:
+        """Product of the components from i, from the closest valid checkpoint (storing the checkpoints passed)"""
+        n = len(self._components)
+        end = min(n, -(-max(i, self._suffix_valid) // self._stride) * self._stride)
+        u = self._suffix[end].copy() if end < n else np.eye(self._m, dtype=complex)
+        for j in range(end - 1, i - 1, -1):
+            r = self._components[j][0]
+            u[:, r[0]:r[-1] + 1] = u[:, r[0]:r[-1] + 1] @ self._blocks[j]
+            if j % self._stride == 0:
+                self._suffix[j] = u.copy()
+        self._suffix_valid = min(self._suffix_valid, -(-i // self._stride) * self._stride)
+        return u
+
+    def update(self) -> np.ndarray:
+        """Update the unitary according to the current parameter values of the components"""
+        for i, (r, component) in enumerate(self._components):
+            key = self._component_key(component)
+            if key is not None and key == self._keys[i]:
+                continue
+            self._keys[i] = key
+            block = self._component_unitary(component)
+            if np.array_equal(block, self._blocks[i]):
+                continue
+            prefix = self._prefix_product(i)
+            suffix = self._suffix_product(i + 1)
+            delta = block - self._blocks[i]
+            self._blocks[i] = block
+            self._update_count += 1
+            if self._update_count >= self.REFRESH_PERIOD:
+                prefix[r[0]:r[-1] + 1, :] = block @ prefix[r[0]:r[-1] + 1, :]
+                self.unitary = suffix @ prefix
+                self._update_count = 0
+            else:
+                self.unitary += suffix[:, r[0]:r[-1] + 1] @ delta @ prefix[r[0]:r[-1] + 1, :]
+            # Checkpoints including component i are now outdated
+            self._prefix_valid = min(self._prefix_valid, i)
+            self._suffix_valid = max(self._suffix_valid, i + 1)
+        return self.unitary
+
+
 class Circuit(ACircuit):
     """Class to represent any circuit composed of one or multiple components
 
@@ -287,6 +385,7 @@ class Circuit(ACircuit):
     """
     DEFAULT_NAME = "CPLX"
     _color = None  # A circuit can be given a background color when displayed as a subcircuit
+    _unitary_cache = None
 
     def __init__(self, m: int, name: str = None):
         assert m > 0, "invalid size"
@@ -498,6 +597,8 @@ class Circuit(ACircuit):
                                  use_symbolic: bool,
                                  use_polarization: bool) -> Matrix:
         """compute the unitary matrix corresponding to the current circuit"""
+        if not use_symbolic and not use_polarization and self._components:
+            return self._compute_numeric_unitary()
         u = None
         multiplier = 2 if use_polarization else 1
         for r, c in self._components:
@@ -512,6 +613,14 @@ class Circuit(ACircuit):
                 u = cU @ u
         return u
 
+    def _compute_numeric_unitary(self) -> Matrix:
+        if self._unitary_cache is not None and self._unitary_cache.matches(self._components):
+            u = self._unitary_cache.update()
+        else:
+            self._unitary_cache = _IncrementalUnitary(self._m, self._components)
+            u = self._unitary_cache.unitary
+        return Matrix(u.copy())
+
     def inverse(self, v=False, h=False):
         _new_components = []
         _components = self._components
@@ -572,6 +681,7 @@ class Circuit(ACircuit):
         nc = copy.deepcopy(self)
         nc._params = {}
         nc._components = []
+        nc._unitary_cache = None
         for r, c in self._components:
             nc.add(r, c.copy(subs=subs))
         return nc
@@ -26,16 +26,21 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+from collections import defaultdict
+import random
+
 from numpy import Inf
 
 from .abstract_processor import AProcessor, ProcessorType
 from .source import Source
 from .linear_circuit import ACircuit
-from perceval.utils import SVDistribution, BSDistribution, BSSamples, BasicState, StateVector, LogicalState
-from perceval.backends import ABackend, ASamplingBackend, BACKEND_LIST
+from perceval.utils import SVDistribution, BSDistribution, FSDistribution, BSSamples, BasicState, StateVector, \
+    LogicalState
+from perceval.backends import ABackend, ASamplingBackend, AProbAmpliBackend, BACKEND_LIST, BackendFactory, \
+    SamplingAdapter
 
 from multipledispatch import dispatch
-from typing import Dict, Callable, Union, List
+from typing import Dict, Callable, Union, List, Optional
 
 
 class Processor(AProcessor):
@@ -43,7 +48,8 @@ class Processor(AProcessor):
     Generic definition of processor as a source + components (both unitary and non-unitary) + ports
     + optional post-processing logic
 
-    :param backend: Name or instance of a simulation backend
+    :param backend: Name or instance of a simulation backend. The "auto" name chooses the backend from cost estimations
+        once an input state is set (see `Processor.backend`).
     :param m_circuit: can either be:
 
         - an int: number of modes of interest (MOI). A mode of interest is any non-heralded mode.
@@ -55,12 +61,25 @@ class Processor(AProcessor):
     :param source: the Source used by the processor (defaults to perfect source)
     :param name: a textual name for the processor (defaults to "Local processor")
     """
+    _INPUT_SAMPLING_BATCH = 4096  # Input states are drawn by batches while sampling
+
     def __init__(self, backend: Union[ABackend, str], m_circuit: Union[int, ACircuit] = None, source: Source = Source(),
                  name: str = None):
         super().__init__()
         self._source = source
         self.name = "Local processor" if name is None else name
 
+        self._backend = None  # Chosen when needed for the "auto" backend, and reset when the problem changes
+        self._auto_backend = backend == "auto"
+        if isinstance(backend, str):
+            assert self._auto_backend or backend in BACKEND_LIST, f"Simulation backend '{backend}' does not exist"
+            if not self._auto_backend:
+                self._backend = BACKEND_LIST[backend]()
+        else:
+            self._backend = backend
+        self._simulator = None
+        self._sampling_adapter = None
+
         if isinstance(m_circuit, ACircuit):
             self._n_moi = m_circuit.m
             self.add(0, m_circuit)
@@ -68,16 +87,40 @@ class Processor(AProcessor):
             self._n_moi = m_circuit  # number of modes of interest (MOI)
 
         self._inputs_map: Union[SVDistribution, None] = None
-        if isinstance(backend, str):
-            assert backend in BACKEND_LIST, f"Simulation backend '{backend}' does not exist"
-            self.backend = BACKEND_LIST[backend]()
-        else:
-            self.backend = backend
-        self._simulator = None
 
     def type(self) -> ProcessorType:
         return ProcessorType.SIMULATOR
 
+    @property
+    def backend(self) -> Optional[ABackend]:
+        """The simulation backend
+
+        An "auto" backend is chosen from cost estimations (see `BackendFactory.choose`) when first needed after an
+        input state is set: it is None until then. The choice is made again whenever the input or the circuit
+        changes. As the processor always computes the whole output distribution, costs are estimated for the whole
+        distribution too. The choice falls back on SLOS when the cost cannot be estimated (non-unitary components, or
+        an input distribution instead of a single state).
+        """
+        if self._backend is None and self._auto_backend and self._input_state is not None:
+            if self._is_unitary and isinstance(self._input_state, BasicState):
+                self._backend = BackendFactory.get_backend("auto", circuit=self.linear_circuit(),
+                                                           input_state=self._input_state)
+            else:
+                self._backend = BackendFactory.get_backend("SLOS")
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend: ABackend):
+        self._backend = backend
+        self._auto_backend = False
+
+    def _reset_auto_backend(self):
+        """Drop an "auto" backend chosen for a previous input or circuit, along with the objects using it"""
+        if self._auto_backend:
+            self._backend = None
+            self._simulator = None
+            self._sampling_adapter = None
+
     @property
     def is_remote(self) -> bool:
         return False
@@ -123,6 +166,7 @@ class Processor(AProcessor):
                 input_idx += 1
 
         self._input_state = BasicState(input_list)
+        self._reset_auto_backend()
         self._inputs_map = self._source.generate_distribution(self._input_state)
         self._min_detected_photons = expected_photons
         if 'min_detected_photons' in self._parameters:
@@ -147,6 +191,7 @@ class Processor(AProcessor):
         """
         assert self.m is not None, "A circuit has to be set before the input distribution"
         self._input_state = svd
+        self._reset_auto_backend()
         expected_photons = Inf
         for sv in svd:
             for state in sv.keys():
@@ -162,10 +207,12 @@ class Processor(AProcessor):
     def _circuit_changed(self):
         # Override parent's method to reset the internal simulator as soon as the component list changes
         self._simulator = None
+        self._reset_auto_backend()
 
     def with_polarized_input(self, bs: BasicState):
         assert bs.has_polarization, "BasicState is not polarized, please use with_input instead"
         self._input_state = bs
+        self._reset_auto_backend()
         self._inputs_map = SVDistribution(bs)
         self._min_detected_photons = bs.n
         if 'min_detected_photons' in self._parameters:
@@ -174,6 +221,7 @@ class Processor(AProcessor):
     def clear_input_and_circuit(self, new_m=None):
         super().clear_input_and_circuit(new_m)
         self._inputs_map = None
+        self._reset_auto_backend()
 
     def _compose_processor(self, connector, processor, keep_port: bool):
         assert isinstance(processor, Processor), "can not mix types of processors"
@@ -188,11 +236,45 @@ class Processor(AProcessor):
             return modes_with_photons >= self._min_detected_photons
         return output_state.n >= self._min_detected_photons
 
+    def _sampling_backend(self) -> ASamplingBackend:
+        """The backend itself if it can sample, or else an adapter sampling the distributions it computes (kept
+        between calls so that its output distributions are reused)"""
+        if isinstance(self.backend, ASamplingBackend):
+            return self.backend
+        assert isinstance(self.backend, AProbAmpliBackend), "A sampling backend is required to call samples method"
+        if self._sampling_adapter is None or self._sampling_adapter.backend is not self.backend:
+            self._sampling_adapter = SamplingAdapter(self.backend)
+        return self._sampling_adapter
+
+    @staticmethod
+    def _sample_batch(backend: ASamplingBackend, input_states: List[BasicState]) -> List[BasicState]:
+        """Draws one output state for each input state, the shots sharing the same input state being sampled together"""
+        shots = defaultdict(list)
+        for i, input_state in enumerate(input_states):
+            shots[input_state].append(i)
+        sampled_states = [None] * len(input_states)
+        for input_state, indexes in shots.items():
+            if input_state.has_annotations and not backend.ACCEPTS_ANNOTATED_STATES:
+                # In case of annotations, input must be separately sampled, then recombined
+                samples = None
+                for bs in input_state.separate_state():
+                    backend.set_input_state(bs)
+                    components = backend.samples(len(indexes))
+                    samples = components if samples is None else [s.merge(c) for s, c in zip(samples, components)]
+            else:
+                backend.set_input_state(input_state)
+                samples = backend.samples(len(indexes))
+            for i, sampled_state in zip(indexes, samples):
+                sampled_states[i] = sampled_state
+        return sampled_states
+
     def samples(self, max_samples: int, max_shots: int = None, progress_callback=None) -> Dict:
-        assert isinstance(self.backend, ASamplingBackend), "A sampling backend is required to call samples method"
+        backend = self._sampling_backend()
         pre_physical_perf = 1
-        # Rework input map so that it contains only states with enough photons
-        input_svd = SVDistribution()
+        # Rework input map so that it contains only states with enough photons. Input states are then drawn by batches
+        # from this distribution (null states excluded), the cumulative weights being computed once.
+        input_svs = []
+        cum_weights = []
         zpp = 0  # Zero photon probability
         for sv, p in self._inputs_map.items():
             if max(sv.n) == 0:
@@ -200,40 +282,39 @@ class Processor(AProcessor):
             if self._state_preselected_physical(sv):
                 if len(sv) > 1:
                     raise RuntimeError("Cannot sample on a superposed state")
-                input_svd[sv] = p
+                if max(sv.n) != 0:
+                    input_svs.append(sv)
+                    cum_weights.append(p + (cum_weights[-1] if cum_weights else 0))
             else:
                 pre_physical_perf -= p
         if max_shots is not None:
             max_shots = round(max_shots*(1 - zpp))
 
-        self.backend.set_circuit(self.linear_circuit())
+        backend.set_circuit(self.linear_circuit())
+        input_states = {}  # Index of an input state vector -> its basic state, only converted once drawn
         output = BSSamples()
-        selected_inputs = []
+        sampled_states = []
         idx = 0
         not_selected_physical = 0
         not_selected = 0
         shots = 0
         while len(output) < max_samples and (max_shots is None or shots < max_shots):
-            if idx == len(selected_inputs):
+            if idx == len(sampled_states):
                 idx = 0
-                selected_inputs = input_svd.sample(max_samples)
-            selected_bs = selected_inputs[idx][0]
+                batch_size = min(max_samples - len(output), self._INPUT_SAMPLING_BATCH)
+                if max_shots is not None:
+                    batch_size = min(batch_size, max_shots - shots)
+                if not input_svs:
+                    raise RuntimeError("No state to sample from")
+                selected_inputs = []
+                for i in random.choices(range(len(input_svs)), cum_weights=cum_weights, k=batch_size):
+                    if i not in input_states:
+                        input_states[i] = input_svs[i][0]
+                    selected_inputs.append(input_states[i])
+                sampled_states = self._sample_batch(backend, selected_inputs)
+            sampled_state = sampled_states[idx]
             idx += 1
 
-            # Sampling
-            if selected_bs.has_annotations:  # In case of annotations, input must be separately sampled, then recombined
-                bs_list = selected_bs.separate_state()
-                sampled_components = []
-                for bs in bs_list:
-                    self.backend.set_input_state(bs)
-                    sampled_components.append(self.backend.sample())
-                sampled_state = sampled_components.pop()
-                for component in sampled_components:
-                    sampled_state = sampled_state.merge(component)
-            else:
-                self.backend.set_input_state(selected_bs)
-                sampled_state = self.backend.sample()
-
             # Post-processing
             shots += 1
             if not self._state_selected_physical(sampled_state):
@@ -258,28 +339,69 @@ class Processor(AProcessor):
             logical_perf = selected / (selected + not_selected)
         return {'results': output, 'physical_perf': physical_perf, 'logical_perf': logical_perf}
 
+    def _click_pattern_input(self) -> Optional[BasicState]:
+        """Returns the input state when the output distribution can be computed directly on threshold detection click
+        patterns, i.e. with threshold detection only, a single input state of indistinguishable photons and a circuit
+        the backend can simulate without a simulation layer (no polarization, losses or time delays)"""
+        if not self.is_threshold or self.heralds or self._postselect is not None or not self._is_unitary \
+                or not isinstance(self.backend, AProbAmpliBackend) or len(self._inputs_map) != 1:
+            return None
+        if any(component.requires_polarization for _, component in self.components):
+            return None
+        sv = next(iter(self._inputs_map.keys()))
+        if len(sv) != 1 or sv[0].has_annotations:
+            return None
+        return BasicState(sv[0])
+
+    def _click_pattern_probs(self, input_state: BasicState, progress_callback: Callable = None) -> Dict:
+        self.backend.set_circuit(self.linear_circuit())
+        self.backend.set_input_state(input_state)
+        results = BSDistribution()
+        pperf = 1
+        for state, prob in self.backend.threshold_prob_distribution().items():
+            if self._state_selected_physical(state):
+                results[state] += prob
+            else:
+                pperf -= prob
+        results.normalize()
+        if progress_callback:
+            progress_callback(1., 'probs')
+        return {'results': results, 'physical_perf': pperf, 'logical_perf': 1}
+
     def probs(self, precision: float = None, progress_callback: Callable = None) -> Dict:
         # assert self._inputs_map is not None, "Input is missing, please call with_inputs()"
+        click_pattern_input = self._click_pattern_input()
+        if click_pattern_input is not None:
+            return self._click_pattern_probs(click_pattern_input, progress_callback)
+        from perceval.simulators import SimulatorFactory  # Avoids a circular import
         if self._simulator is None:
-            from perceval.simulators import SimulatorFactory  # Avoids a circular import
             self._simulator = SimulatorFactory.build(self)
         else:
             self._simulator.set_circuit(self.linear_circuit() if self._is_unitary else self.components)
 
         if precision is not None:
             self._simulator.set_precision(precision)
-        res = self._simulator.probs_svd(self._inputs_map, progress_callback=progress_callback)
+        # The output distribution may be left in its array form, converted only once below
+        res = self._simulator.probs_svd(self._inputs_map, progress_callback=progress_callback, keep_array=True)
         lperf = 1
         pperf = 1
-        postprocessed_res = BSDistribution()
-        for state, prob in res['results'].items():
-            if not self._state_selected_physical(state):
-                pperf -= prob
-                continue
-            if self._state_selected(state):
-                postprocessed_res[self.postprocess_output(state)] += prob
-            else:
-                lperf -= prob
+        if isinstance(res['results'], FSDistribution) and not self.heralds and self._postselect is None \
+                and not self.is_threshold and res['results'].n >= self._min_detected_photons:
+            # Every state is selected and left untouched by the post-processing: convert the array form only once
+            postprocessed_res = res['results'].to_bsd()
+        else:
+            results = res['results']
+            if isinstance(results, FSDistribution):
+                results = results.to_bsd()
+            postprocessed_res = BSDistribution()
+            for state, prob in results.items():
+                if not self._state_selected_physical(state):
+                    pperf -= prob
+                    continue
+                if self._state_selected(state):
+                    postprocessed_res[self.postprocess_output(state)] += prob
+                else:
+                    lperf -= prob
         postprocessed_res.normalize()
         res['logical_perf'] = res['logical_perf']*lperf if 'logical_perf' in res else lperf
         res['physical_perf'] = res['physical_perf']*pperf if 'physical_perf' in res else pperf
@@ -288,4 +410,6 @@ class Processor(AProcessor):
 
     @property
     def available_commands(self) -> List[str]:
+        if self._backend is None or isinstance(self.backend, AProbAmpliBackend):  # "auto" only chooses among these
+            return ["samples", "probs"]  # Backends computing probabilities sample through a SamplingAdapter
         return ["samples" if isinstance(self.backend, ASamplingBackend) else "probs"]
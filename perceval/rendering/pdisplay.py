@@ -54,7 +54,7 @@ from perceval.rendering.circuit import DisplayConfig, create_renderer, ModeStyle
 from perceval.utils.format import simple_float, simple_complex
 from perceval.utils.matrix import Matrix
 from perceval.utils.mlstr import mlstr
-from perceval.utils.statevector import ProbabilityDistribution, StateVector, BSCount
+from perceval.utils.statevector import ProbabilityDistribution, StateVector, BSCount, FSDistribution
 from .format import Format
 from ._processor_utils import precompute_herald_pos
 
@@ -357,7 +357,7 @@ def _pdisplay(analyzer, **kwargs):
     return pdisplay_analyzer(analyzer, **kwargs)
 
 
-@dispatch((StateVector, ProbabilityDistribution))
+@dispatch((StateVector, ProbabilityDistribution, FSDistribution))
 def _pdisplay(distrib, **kwargs):
     # Work on a copy, in order to not force normalization simply because of a display call
     normalized_dist = copy.copy(distrib)
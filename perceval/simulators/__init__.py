@@ -30,6 +30,6 @@
 from .delay_simulator import DelaySimulator
 from .loss_simulator import LossSimulator
 from .polarization_simulator import PolarizationSimulator
-from .simulator import Simulator
+from .simulator import Simulator, SimulatorStats
 from .simulator_factory import SimulatorFactory
 from .stepper import Stepper
@@ -27,12 +27,16 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from perceval.utils import BasicState, BSDistribution, StateVector, Annotation
+from perceval.utils import BasicState, BSDistribution, FSDistribution, StateVector, Annotation
 from perceval.components import Circuit
+from perceval.backends import fock_space_map_table
 from copy import copy
 from math import sqrt
 from typing import List
 
+import exqalibur as xq
+import numpy as np
+
 
 def _to_bsd(sv: StateVector) -> BSDistribution:
     res = BSDistribution()
@@ -42,6 +46,30 @@ def _to_bsd(sv: StateVector) -> BSDistribution:
     return res
 
 
+def _distinguishable_distribution(mode_probs: np.ndarray) -> FSDistribution:
+    """Output distribution of fully distinguishable photons, where photon k independently ends in mode j with the
+    probability mode_probs[k, j] (i.e. |U[j, i_k]|^2 for a photon entering mode i_k).
+
+    The probability of an output state s is the permanent of the corresponding sub-matrix of mode_probs divided by the
+    product of the s_j!, which is computed for all output states at once by adding photons one at a time: the k photon
+    probabilities are p_k[s + e_j] = sum_j p_{k-1}[s] * mode_probs[k, j], through the Fock space maps of SLOS.
+    The whole output Fock space is still enumerated: this only saves the state instantiations and merges of successive
+    tensor products. Output states of distinguishable photons are sampled in polynomial time by Clifford2017Backend.
+
+    :param mode_probs: (n, m) array of the output mode probabilities of each photon
+    :return: the output distribution of the n photons
+    """
+    n, m = mode_probs.shape
+    probs = np.ones(1)
+    for k in range(1, n + 1):
+        table = fock_space_map_table(m, k)
+        new_probs = np.zeros(table.max() + 1)
+        for j in range(m):
+            new_probs[table[:, j]] += probs * mode_probs[k - 1, j]  # Adding a photon in mode j is injective
+        probs = new_probs
+    return FSDistribution(xq.FSArray(m, n), probs)
+
+
 def _inject_annotation(sv: StateVector, annotation: Annotation) -> StateVector:
     res_sv = copy(sv)
     if len(annotation):
@@ -26,16 +26,53 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-from ._simulator_utils import _to_bsd, _inject_annotation, _merge_sv, _annot_state_mapping
+from ._simulator_utils import _to_bsd, _inject_annotation, _merge_sv, _annot_state_mapping, \
+    _distinguishable_distribution
 from .simulator_interface import ISimulator
 from perceval.components import ACircuit
-from perceval.utils import BasicState, BSDistribution, StateVector, SVDistribution, PostSelect, global_params
-from perceval.backends import AProbAmpliBackend
+from perceval.utils import BasicState, BSDistribution, FSDistribution, StateVector, SVDistribution, PostSelect, \
+    LRUCache, global_params
+from perceval.backends import AProbAmpliBackend, SLOSBackend
 
 from copy import copy
 from multipledispatch import dispatch
 from numbers import Number
-from typing import Callable, Set, Union, Optional
+from typing import Callable, Dict, List, Set, Union, Optional
+
+import numpy as np
+
+
+def _result_nbytes(result: Union[StateVector, BSDistribution, FSDistribution]) -> int:
+    """Approximate memory footprint of an evolved state vector or an output distribution: an amplitude (or probability)
+    and, unless stored in a Fock state array, an occupation per mode for each of its basic states"""
+    if isinstance(result, FSDistribution):
+        return result.probabilities.nbytes
+    if isinstance(result, StateVector):
+        return len(result) * (16 + 8 * result.m)
+    return sum(8 + 8 * state.m for state in result)
+
+
+class SimulatorStats:
+    """Counters of the work done by a Simulator
+
+    :ivar cache_hits: number of input states whose evolution (or output distribution) was found in cache
+    :ivar cache_misses: number of input states computed by the backend, as they were not in cache
+    :ivar cache_evictions: number of results evicted from the cache to keep it within its size
+    :ivar merge_count: number of merges of partial results, one per group of indistinguishable photons
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.cache_hits: int = 0
+        self.cache_misses: int = 0
+        self.cache_evictions: int = 0
+        self.merge_count: int = 0
+
+    def __repr__(self):
+        return f"SimulatorStats(cache_hits={self.cache_hits}, cache_misses={self.cache_misses}, " \
+               f"cache_evictions={self.cache_evictions}, merge_count={self.merge_count})"
 
 
 class Simulator(ISimulator):
@@ -45,17 +82,34 @@ class Simulator(ISimulator):
     or simulate the sampling a states with annotated photons.
 
     :param backend: A probability amplitude capable backend object
+    :param cache_size: maximum size of the cache of evolved states and output distributions, in bytes (least recently
+        used ones are evicted first)
     """
 
-    def __init__(self, backend: AProbAmpliBackend):
+    def __init__(self, backend: AProbAmpliBackend, cache_size: int = 1 << 28):
         self._backend = backend
-        self._invalidate_cache()
+        self._cache = LRUCache(cache_size, sizeof=_result_nbytes)
+        self._stats = SimulatorStats()
+        self._umat = None  # Unitary matrix of the current circuit, which the cached results are valid for
         self._postselect: PostSelect = PostSelect()
         self._logical_perf: float = 1
         self._physical_perf: float = 1
         self._rel_precision: float = 1e-6  # Precision relative to the highest probability of interest in probs_svd
         self._min_detected_photons: int = 0
 
+    @property
+    def stats(self) -> SimulatorStats:
+        return self._stats
+
+    @property
+    def cache_size(self) -> int:
+        """Maximum size of the cache of evolved states and output distributions, in bytes"""
+        return self._cache.max_size
+
+    @cache_size.setter
+    def cache_size(self, value: int):
+        self._cache.max_size = value
+
     @property
     def precision(self):
         return self._rel_precision
@@ -94,10 +148,19 @@ class Simulator(ISimulator):
     def set_circuit(self, circuit: ACircuit):
         """Set a circuit for simulation.
 
+        Cached results are kept when the new circuit has the same unitary matrix as the current one (e.g. the same
+        circuit with unchanged parameter values).
+
         :param circuit: a unitary circuit without polarized components
         """
-        self._invalidate_cache()
+        # The backend may be shared with other users (e.g. a Processor sampling with it): always forward the circuit
         self._backend.set_circuit(circuit)
+        umat = np.asarray(self._backend.unitary)
+        if umat.dtype == object:
+            umat = None  # Symbolic unitary matrix, not compared
+        if umat is None or self._umat is None or not np.array_equal(self._umat, umat):
+            self._invalidate_cache()
+        self._umat = umat
 
     @dispatch(BasicState, BasicState)
     def prob_amplitude(self, input_state: BasicState, output_state: BasicState) -> complex:
@@ -169,22 +232,76 @@ class Simulator(ISimulator):
         return result
 
     def _invalidate_cache(self):
-        self._evolve = {}
-        self.DEBUG_evolve_count = 0
-        self.DEBUG_merge_count = 0
+        self._cache.clear()
+
+    def _cached_results(self, kind: str, input_list: Set[BasicState], compute: Callable) -> Dict:
+        """Compute a result for each input state with the backend, reusing the ones found in cache.
 
-    def _evolve_cache(self, input_list: Set[BasicState]):
+        :param kind: kind of result, part of the cache key
+        :param compute: function computing the result once the backend input state is set
+        :return: the result of each input state. They are returned rather than read back from the cache, which may
+            have evicted some of them in the meantime.
+        """
+        results = {}
         for state in input_list:
-            if state not in self._evolve:
+            key = (kind, state)
+            result = self._cache.get(key)
+            if result is None:
                 self._backend.set_input_state(state)
-                self._evolve[state] = self._backend.evolve()
-                self.DEBUG_evolve_count += 1
+                result = compute()
+                self._stats.cache_misses += 1
+                cache_len = len(self._cache)
+                if self._cache.put(key, result):
+                    self._stats.cache_evictions += cache_len + 1 - len(self._cache)
+            else:
+                self._stats.cache_hits += 1
+            results[state] = result
+        return results
 
-    def _merge_probability_dist(self, input_list) -> BSDistribution:
+    def _evolve_cache(self, input_list: Set[BasicState]) -> Dict[BasicState, StateVector]:
+        return self._cached_results("evolve", input_list, self._backend.evolve)
+
+    def _prob_distribution_cache(self, input_list: Set[BasicState]) -> Dict[BasicState, BSDistribution]:
+        if isinstance(self._backend, SLOSBackend):
+            return self._cached_results("probs", input_list, self._backend.fs_distribution)
+        return self._cached_results("probs", input_list, self._backend.prob_distribution)
+
+    @staticmethod
+    def _split_distinguishable(input_list: List[BasicState]):
+        """Split separated input states between single photons (distinguishable from all the others) and the rest.
+        Single photons are only split out when there are at least two of them."""
+        single_photons = [state for state in input_list if state.n == 1]
+        if len(single_photons) < 2:
+            return [], input_list
+        return single_photons, [state for state in input_list if state.n != 1]
+
+    @staticmethod
+    def _distinguishable_probs(single_photons: List[BasicState], distributions: Callable) -> FSDistribution:
+        """Joint output distribution of fully distinguishable photons, computed at once from the output distribution
+        of each single photon, instead of merging them one photon at a time.
+
+        :param single_photons: the single photon input states
+        :param distributions: function returning the output distribution of a single photon input state
+        """
+        m = single_photons[0].m
+        mode_probs = np.zeros((len(single_photons), m))
+        for k, photon in enumerate(single_photons):
+            distribution = distributions(photon)
+            if isinstance(distribution, FSDistribution):
+                mode_probs[k] = distribution.probabilities  # One photon states are sorted by mode
+            else:
+                for state, prob in distribution.items():
+                    mode_probs[k, state.photon2mode(0)] = prob
+        return _distinguishable_distribution(mode_probs)
+
+    def _merge_probability_dist(self, input_list, evolved: Dict[BasicState, StateVector]) -> BSDistribution:
         results = BSDistribution()
+        single_photons, input_list = self._split_distinguishable(input_list)
+        if single_photons:
+            results = self._distinguishable_probs(single_photons, lambda state: _to_bsd(evolved[state])).to_bsd()
         for input_state in input_list:
-            results = BSDistribution.tensor_product(results, _to_bsd(self._evolve[input_state]), merge_modes=True)
-            self.DEBUG_merge_count += 1
+            results = BSDistribution.tensor_product(results, _to_bsd(evolved[input_state]), merge_modes=True)
+            self._stats.merge_count += 1
         return results
 
     def _post_select_on_distribution(self, bsd: BSDistribution) -> BSDistribution:
@@ -192,6 +309,8 @@ class Simulator(ISimulator):
         if not self._postselect.has_condition:
             bsd.normalize()
             return bsd
+        if isinstance(bsd, FSDistribution):
+            bsd = bsd.to_bsd()
         result = BSDistribution()
         for state, prob in bsd.items():
             if self._postselect(state):
@@ -209,8 +328,8 @@ class Simulator(ISimulator):
         :return: The post-selected output state distribution (BSDistribution)
         """
         input_list = input_state.separate_state(keep_annotations=False)
-        self._evolve_cache(set(input_list))
-        result = self._merge_probability_dist(input_list)
+        evolved = self._evolve_cache(set(input_list))
+        result = self._merge_probability_dist(input_list, evolved)
         return self._post_select_on_distribution(result)
 
     @dispatch(StateVector)
@@ -252,7 +371,7 @@ class Simulator(ISimulator):
             else:
                 self._physical_perf -= prob
         input_set = set([state for s in decomposed_input for t in s[1] for state in t[1].values()])
-        self._evolve_cache(input_set)
+        evolved = self._evolve_cache(input_set)
 
         """Reconstruct output probability distribution"""
         res = BSDistribution()
@@ -263,11 +382,11 @@ class Simulator(ISimulator):
                 prob_sv = abs(probampli)**2
                 evolved_in_s = StateVector()
                 for annot, in_s in instate_list.items():
-                    cached_res = _inject_annotation(self._evolve[in_s], annot)
+                    cached_res = _inject_annotation(evolved[in_s], annot)
                     evolved_in_s = _merge_sv(evolved_in_s, cached_res, prob_threshold=p_threshold / (10 * prob_sv * prob0))
                     if len(evolved_in_s) == 0:
                         break
-                    self.DEBUG_merge_count += 1
+                    self._stats.merge_count += 1
                 if evolved_in_s:
                     result_sv += probampli*evolved_in_s
 
@@ -305,23 +424,37 @@ class Simulator(ISimulator):
             else:
                 self._physical_perf -= prob
         input_set = set([state for s in decomposed_input for state in s[1]])
-        cache = {}
-        for state in input_set:
-            self._backend.set_input_state(state)
-            cache[state] = self._backend.prob_distribution()
+        cache = self._prob_distribution_cache(input_set)
+
+        if len(decomposed_input) == 1 and len(decomposed_input[0][1]) == 1 \
+                and isinstance(cache[decomposed_input[0][1][0]], FSDistribution):
+            # A single pure input: the output distribution is directly the backend result, kept in its array form
+            prob0, bs_data = decomposed_input[0]
+            if progress_callback:
+                progress_callback(1., 'probs')
+            res = cache[bs_data[0]]
+            return FSDistribution(res.fock_array, res.probabilities * prob0)
 
         """Reconstruct output probability distribution"""
         res = BSDistribution()
+        distinguishable_cache = {}
         for idx, (prob0, bs_data) in enumerate(decomposed_input):
             """First, recombine evolved state vectors given a single input"""
             probs_in_s = BSDistribution()
+            single_photons, bs_data = self._split_distinguishable(bs_data)
+            if single_photons:
+                # Fully distinguishable photons only depend on their input modes
+                key = tuple(sorted(photon.photon2mode(0) for photon in single_photons))
+                if key not in distinguishable_cache:
+                    distinguishable_cache[key] = self._distinguishable_probs(single_photons, cache.get).to_bsd()
+                probs_in_s = distinguishable_cache[key]
             for in_s in bs_data:
                 probs_in_s = BSDistribution.tensor_product(probs_in_s, cache[in_s],
                                                            merge_modes=True,
                                                            prob_threshold=p_threshold / (10*prob0))
                 if len(probs_in_s) == 0:
                     break
-                self.DEBUG_merge_count += 1
+                self._stats.merge_count += 1
 
             """Then, add the resulting distribution to the global distribution"""
             if probs_in_s:
@@ -335,19 +468,21 @@ class Simulator(ISimulator):
         return res
 
 
-    def probs_svd(self, input_dist: SVDistribution, progress_callback: Optional[Callable] = None):
+    def probs_svd(self, input_dist: SVDistribution, progress_callback: Optional[Callable] = None,
+                  keep_array: bool = False):
         """
         Compute the probability distribution from a SVDistribution input and as well as performance scores
 
         :param input_dist: A state vector distribution describing the input to simulate
         :param progress_callback: A function with the signature `func(progress: float, message: str)`
+        :param keep_array: if True, the results of a single pure input simulated by SLOS are left in their array form
+            (FSDistribution, which includes null probability states) instead of being converted to a BSDistribution
 
         :return: A dictionary of the form { "results": BSDistribution, "physical_perf": float, "logical_perf": float }
         * results is the post-selected output state distribution
         * physical_perf is the performance computed from the detected photon filter
         * logical_perf is the performance computed from the post-selection
         """
-
         """Trim input SVD given _rel_precision threshold"""
         max_p = 0
         has_superposed_states = False
@@ -363,7 +498,10 @@ class Simulator(ISimulator):
         else:
             res = self._probs_svd_fast(svd, p_threshold, progress_callback)
 
-        return {'results': self._post_select_on_distribution(res),
+        res = self._post_select_on_distribution(res)
+        if not keep_array and isinstance(res, FSDistribution):
+            res = res.to_bsd()
+        return {'results': res,
                 'physical_perf': self._physical_perf,
                 'logical_perf': self._logical_perf}
 
@@ -382,7 +520,7 @@ class Simulator(ISimulator):
         input_list = [copy(state) for t in decomposed_input for state in t[1]]
         for state in input_list:
             state.clear_annotations()
-        self._evolve_cache(set(input_list))
+        evolved = self._evolve_cache(set(input_list))
 
         result_sv = StateVector()
         for probampli, instate_list in decomposed_input:
@@ -393,13 +531,13 @@ class Simulator(ISimulator):
                     continue
                 annotation = in_s.get_photon_annotation(0)
                 in_s.clear_annotations()
-                reslist.append(_inject_annotation(self._evolve[in_s], annotation))
+                reslist.append(_inject_annotation(evolved[in_s], annotation))
 
             # Recombine results for one basic state input
             evolved_in_s = reslist.pop(0)
             for sv in reslist:
                 evolved_in_s = _merge_sv(evolved_in_s, sv)
-                self.DEBUG_merge_count += 1
+                self._stats.merge_count += 1
             result_sv += evolved_in_s * probampli
 
         result_sv.normalize()
@@ -34,8 +34,10 @@ from .loss_simulator import LossSimulator
 from .polarization_simulator import PolarizationSimulator
 from ._simulator_utils import _unitary_components_to_circuit
 from perceval.components import ACircuit, TD, LC, Processor
-from perceval.backends import ABackend, SLOSBackend, NaiveBackend, BACKEND_LIST
+from perceval.utils import BasicState
+from perceval.backends import ABackend, SLOSBackend, NaiveBackend, BACKEND_LIST, BackendFactory
 
+import warnings
 from typing import List, Union
 
 
@@ -56,7 +58,8 @@ class SimulatorFactory:
             + TD, or a Processor object.
         :param backend: (Optional) Any probampli capable backend instance or name. If no backend is passed, then the
             processor backend name is used if the first parameter's type is Processor. Ultimately, the fallback is a
-            SLOS backend instanciated without any configuration (i.e. no mask)
+            SLOS backend instanciated without any configuration (i.e. no mask). The "auto" name chooses the backend
+            from cost estimations, when a unitary circuit and an input state (from a Processor) are available.
         :return: A simulator object with the input circuit set
         """
         sim_polarization = False
@@ -65,6 +68,7 @@ class SimulatorFactory:
         convert_to_circuit = False
         min_detected_photons = None
         m = 0
+        input_state = None
         if isinstance(circuit, ACircuit):
             sim_polarization = circuit.requires_polarization
         else:
@@ -75,6 +79,7 @@ class SimulatorFactory:
                 if backend is None:
                     backend = circuit.backend
                 min_detected_photons = circuit.parameters.get('min_detected_photons')
+                input_state = circuit.input_state
                 circuit = circuit.components
 
             for _, cp in circuit:
@@ -87,6 +92,14 @@ class SimulatorFactory:
                 if not sim_polarization and isinstance(cp, ACircuit):
                     sim_polarization = cp.requires_polarization
 
+        if convert_to_circuit:
+            circuit = _unitary_components_to_circuit(circuit, m)
+        if backend == "auto":
+            if isinstance(circuit, ACircuit) and isinstance(input_state, BasicState):
+                backend = BackendFactory.choose(circuit, input_state)
+            else:
+                warnings.warn('The "auto" backend requires a unitary circuit and an input state. Falling back on SLOS')
+                backend = "SLOS"
         if backend is None:
             backend = SLOSBackend()  # The default is SLOS
         if isinstance(backend, str):
@@ -106,7 +119,5 @@ class SimulatorFactory:
         if sim_losses:
             simulator = LossSimulator(simulator)
 
-        if convert_to_circuit:
-            circuit = _unitary_components_to_circuit(circuit, m)
         simulator.set_circuit(circuit)
         return simulator
@@ -44,8 +44,9 @@ class ISimulator(ABC):
         pass
 
     @abstractmethod
-    def probs_svd(self, svd: SVDistribution, progress_callback: Callable = None) -> Dict:
-        pass
+    def probs_svd(self, svd: SVDistribution, progress_callback: Callable = None, keep_array: bool = False) -> Dict:
+        """Output distribution of an input distribution, along with performance scores. With `keep_array`, the results
+        may be returned as a FSDistribution, when the simulator computes them in this form."""
 
     @abstractmethod
     def evolve(self, input_state) -> StateVector:
@@ -82,7 +83,7 @@ class ASimulatorDecorator(ISimulator, ABC):
         results = self._simulator.probs(self._prepare_input(input_state))
         return self._postprocess_results(results)
 
-    def probs_svd(self, svd: SVDistribution, progress_callback: Callable = None) -> Dict:
+    def probs_svd(self, svd: SVDistribution, progress_callback: Callable = None, keep_array: bool = False) -> Dict:
         probs = self._simulator.probs_svd(self._prepare_input(svd))
         probs['results'] = self._postprocess_results(probs['results'])
         return probs
@@ -32,7 +32,7 @@ from .format import simple_float, simple_complex, format_parameters
 from .parameter import Parameter, P, Expression, E
 from .mlstr import mlstr
 from .statevector import BasicState, StateVector, SVDistribution, BSDistribution, BSCount, BSSamples, \
-    tensorproduct, allstate_iterator, anonymize_annotations
+    FSDistribution, tensorproduct, allstate_iterator, anonymize_annotations
 from .logical_state import LogicalState, generate_all_logical_states
 from .polarization import Polarization, convert_polarized_state, build_spatial_output_states
 from .postselect import PostSelect
@@ -43,5 +43,6 @@ from .conversion import samples_to_sample_count, samples_to_probs, sample_count_
 from .stategenerator import StateGenerator
 from ._enums import Encoding, InterferometerShape, FileFormat
 from .persistent_data import PersistentData
+from .lru_cache import LRUCache
 from .metadata import PMetadata
 from exqalibur import Annotation  # Used to provide the Annotation class to the perceval root namespace
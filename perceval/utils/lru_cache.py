@@ -0,0 +1,121 @@
+# MIT License
+#
+# Copyright (c) 2022 Quandela
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# As a special exception, the copyright holders of exqalibur library give you
+# permission to combine exqalibur with code included in the standard release of
+# Perceval under the MIT license (or modified versions of such code). You may
+# copy and distribute such a combined system following the terms of the MIT
+# license for both exqalibur and Perceval. This exception for the usage of
+# exqalibur is limited to the python bindings used by Perceval.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from collections import OrderedDict
+import sys
+from typing import Any, Callable, Hashable
+
+import numpy as np
+
+
+def nbytes(value: Any) -> int:
+    """Approximate memory footprint of a value, in bytes: the size of the numpy arrays it contains, recursively through
+    lists, tuples and dictionaries"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(nbytes(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """In-memory cache bounded by the total size of its values: when storing a value exceeds the maximum size, the
+    least recently used entries are evicted.
+
+    :param max_size: maximum total size of the cached values, in bytes
+    :param sizeof: function computing the size of a value, in bytes (defaults to `nbytes`)
+    """
+
+    def __init__(self, max_size: int, sizeof: Callable[[Any], int] = nbytes):
+        assert max_size >= 0, "Cache size must be a positive number of bytes"
+        self._max_size = max_size
+        self._sizeof = sizeof
+        self._entries = OrderedDict()  # key -> (value, size), from the least to the most recently used
+        self._size = 0
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, max_size: int):
+        assert max_size >= 0, "Cache size must be a positive number of bytes"
+        self._max_size = max_size
+        self._evict(max_size)
+
+    @property
+    def size(self) -> int:
+        """Current total size of the cached values, in bytes"""
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Retrieve a value and mark it as the most recently used one, or return `default` if it is not in the cache"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> bool:
+        """Store a value (replacing any value with the same key), evicting the least recently used ones if needed.
+
+        :return: False if the value is larger than the cache capacity, and was not stored
+        """
+        self.pop(key)
+        size = self._sizeof(value)
+        if size > self._max_size:
+            return False
+        self._evict(self._max_size - size)
+        self._entries[key] = (value, size)
+        self._size += size
+        return True
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        self._size -= entry[1]
+        return entry[0]
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+
+    def _evict(self, target_size: int):
+        while self._size > target_size:
+            _, (_, size) = self._entries.popitem(last=False)
+            self._size -= size
@@ -27,6 +27,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import math
+import numpy as np
+
 
 def exponentiation_by_squaring(base, power: int):
     """Calculate the result of base^power i.e. base**power using exponentiation by squaring (or square-and-multiply)
@@ -61,3 +64,46 @@ def exponentiation_by_squaring(base, power: int):
         temp_base = temp_base * temp_base
 
     return result
+
+
+def permanent_with_multiplicities(matrix, row_multiplicities, col_multiplicities, chunk_size: int = 1 << 16) -> complex:
+    """Permanent of the matrix built by repeating each row i (resp. column j) of `matrix` row_multiplicities[i] (resp.
+    col_multiplicities[j]) times, without building it
+
+    Ryser's formula sums over subsets of columns: identical columns are grouped, so that only the number x_j of
+    columns picked in each group matters, weighted by a binomial coefficient:
+    perm = (-1)^n sum_x (-1)^|x| prod_j C(s_j, x_j) prod_i (sum_j x_j A_ij)^t_i
+    The cost is proportional to prod(s_j + 1) instead of 2^n (the transposed formula is used when cheaper).
+
+    :param matrix: the (r, c) matrix of distinct rows and columns
+    :param row_multiplicities: repetition count t of each row
+    :param col_multiplicities: repetition count s of each column
+    :param chunk_size: number of terms of the sum evaluated at once
+    """
+    a = np.asarray(matrix, dtype=complex)
+    t = np.asarray(row_multiplicities, dtype=np.int64)
+    s = np.asarray(col_multiplicities, dtype=np.int64)
+    assert a.shape == (len(t), len(s)), "Multiplicities do not match the matrix shape"
+    assert t.sum() == s.sum(), "The repeated matrix must be square"
+    a = a[t > 0][:, s > 0]
+    t = t[t > 0]
+    s = s[s > 0]
+    n = int(s.sum())
+    if n == 0:
+        return complex(1)
+    if np.prod(t + 1, dtype=float) < np.prod(s + 1, dtype=float):
+        a, t, s = a.T, s, t
+
+    term_count = int(np.prod(s + 1))
+    binom = [np.array([math.comb(int(sj), k) for k in range(sj + 1)], dtype=float) for sj in s]
+    total = complex(0)
+    for start in range(0, term_count, chunk_size):
+        x = np.array(np.unravel_index(np.arange(start, min(start + chunk_size, term_count)), s + 1))  # (c, chunk)
+        weights = np.prod([binom[j][x[j]] for j in range(len(s))], axis=0) * (1 - 2 * (x.sum(axis=0) % 2))
+        row_sums = x.T @ a.T  # (chunk, r)
+        products = weights.astype(complex)
+        for i, ti in enumerate(t):
+            for _ in range(ti):  # Repeated products are much faster than complex powers
+                products *= row_sums[:, i]
+        total += products.sum()
+    return complex((-1) ** n * total)
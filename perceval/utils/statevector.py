@@ -302,6 +302,108 @@ class BSDistribution(ProbabilityDistribution):
         return new_dist
 
 
+class FSDistribution:
+    r"""Probability distribution of all the Basic States of a Fock state array, stored as a numpy array.
+
+    Probabilities are kept in the order of the Fock state array, which gives a direct state to index lookup. Basic
+    States are only instantiated when iterating over the distribution, or when converting it to a `BSDistribution`.
+
+    :param fsa: the Fock state array (exqalibur FSArray) listing all the states of the distribution
+    :param probabilities: the probability of each state of `fsa`
+    """
+    def __init__(self, fsa: xq.FSArray, probabilities: np.ndarray):
+        assert len(probabilities) == fsa.count(), "Probability array and Fock state array size mismatch"
+        self._fsa = fsa
+        self._probabilities = np.asarray(probabilities, dtype=float)
+
+    @property
+    def probabilities(self) -> np.ndarray:
+        return self._probabilities
+
+    @property
+    def fock_array(self) -> xq.FSArray:
+        return self._fsa
+
+    @property
+    def m(self) -> int:
+        return self._fsa.m
+
+    @property
+    def n(self) -> int:
+        return self._fsa.n
+
+    def index(self, state: BasicState) -> int:
+        """Return the index of `state` in the probability array, or -1 if it is not part of the distribution"""
+        if state.m != self.m or state.n != self.n:
+            return -1
+        idx = self._fsa.find(state)
+        return -1 if idx == xq.npos else idx
+
+    def __getitem__(self, key) -> float:
+        assert isinstance(key, BasicState), "FSDistribution key must be a BasicState"
+        idx = self.index(key)
+        return 0. if idx == -1 else float(self._probabilities[idx])
+
+    def get(self, key, default=None):
+        idx = self.index(key)
+        return default if idx == -1 else float(self._probabilities[idx])
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, BasicState) and self.index(key) != -1
+
+    def __len__(self):
+        return len(self._probabilities)
+
+    def __iter__(self):
+        return iter(self._fsa)
+
+    def keys(self):
+        return iter(self._fsa)
+
+    def values(self):
+        return iter(self._probabilities)
+
+    def items(self):
+        return zip(self._fsa, self._probabilities)
+
+    def __copy__(self):
+        return FSDistribution(self._fsa, np.copy(self._probabilities))
+
+    def normalize(self):
+        sum_probs = self._probabilities.sum()
+        if sum_probs == 0:
+            warnings.warn("Unable to normalize a distribution with only null probabilities")
+            return
+        self._probabilities /= sum_probs
+
+    def to_bsd(self) -> BSDistribution:
+        """Convert to a BSDistribution, states with a null probability are skipped"""
+        bsd = BSDistribution()
+        for output_state, probability in self.items():
+            bsd.add(output_state, probability)
+        return bsd
+
+    def sample(self, count: int, non_null: bool = True) -> BSSamples:
+        r""" Samples basic states from the distribution
+
+        :param count: number of samples to draw
+        :return: a list of :math:`count` samples
+        """
+        if non_null and self.n == 0:
+            raise RuntimeError("No state to sample from")
+        probs = self._probabilities / self._probabilities.sum()
+        rng = np.random.default_rng()
+        indexes = rng.choice(len(probs), count, p=probs)
+        states = {idx: self._fsa[int(idx)] for idx in np.unique(indexes)}
+        output = BSSamples()
+        for idx in indexes:
+            output.append(BasicState(states[idx]))
+        return output
+
+    def __str__(self):
+        return self.to_bsd().__str__()
+
+
 class BSCount(defaultdict):
     r"""Container that counts basic state events
     """
@@ -28,12 +28,15 @@
 # SOFTWARE.
 
 import math
+import exqalibur as xq
+import numpy as np
 import pytest
 
-from perceval.backends import Clifford2017Backend, NaiveBackend, AProbAmpliBackend, SLOSBackend, MPSBackend,\
-    BackendFactory
-from perceval.components import BS, PS, Circuit, catalog
-from perceval.utils import BSCount, BasicState, Parameter, StateVector
+from perceval.backends import Clifford2017Backend, NaiveBackend, AProbAmpliBackend, SLOSBackend, MPSBackend, FSMapCache, \
+    BackendFactory, SamplingAdapter, fock_space_map_table
+from perceval.backends._slos import _fock_states, _TABLE_ENTRY_SIZE
+from perceval.components import BS, PERM, PS, Circuit, GenericInterferometer, Unitary, catalog
+from perceval.utils import BSCount, BSDistribution, BasicState, FSDistribution, Matrix, Parameter, StateVector
 from _test_utils import assert_sv_close
 
 
@@ -68,6 +71,118 @@ def test_clifford_bs():
     assert n_samples*0.475 < counts[BasicState("|1,0>")] < n_samples*0.525
 
 
+def test_clifford_annotated_input():
+    clifford = Clifford2017Backend()
+    clifford.set_circuit(BS.H())
+    n_samples = 10000
+    for input_state, coincidence_rate in [(BasicState("|{_:0},{_:1}>"), 0.5), (BasicState("|{_:0},{_:0}>"), 0)]:
+        clifford.set_input_state(input_state)
+        samples = clifford.samples(n_samples)
+        assert len(samples) == n_samples
+        assert all(state.n == 2 and not state.has_annotations for state in samples[:100])
+        assert samples.count(BasicState([1, 1])) == pytest.approx(n_samples * coincidence_rate, abs=n_samples * 0.03)
+    assert clifford.sample().n == 2
+
+    # Seeded streams sample each group of indistinguishable photons independently too
+    clifford.set_input_state(BasicState("|{_:0},{_:1}>"))
+    samples = clifford.samples(n_samples, seed=3)
+    assert samples.count(BasicState([1, 1])) == pytest.approx(n_samples * 0.5, abs=n_samples * 0.03)
+
+
+def test_clifford_distinguishable_photons():
+    circuit = Unitary(Matrix.random_unitary(3))
+    slos = SLOSBackend()
+    slos.set_circuit(circuit)
+    clifford = Clifford2017Backend()
+    clifford.set_circuit(circuit)
+    n_samples = 20000
+    # Two distinguishable photons, sampled directly, and a pair of indistinguishable ones
+    input_state = BasicState("|{_:0}{_:2},{_:1},{_:2}>")
+    clifford.set_input_state(input_state)
+    samples = clifford.samples(n_samples)
+    assert len(samples) == n_samples
+
+    expected = BSDistribution()
+    for group in input_state.separate_state():
+        slos.set_input_state(group)
+        expected = BSDistribution.tensor_product(expected, slos.prob_distribution(), merge_modes=True)
+    for state, probability in expected.items():
+        assert samples.count(state) == pytest.approx(n_samples * probability, abs=n_samples * 0.02)
+
+
+def test_clifford_seeded_streams():
+    circuit = Unitary(Matrix.random_unitary(5))
+    input_state = BasicState([1, 0, 2, 0, 1])
+    clifford = Clifford2017Backend()
+    clifford.set_circuit(circuit)
+    clifford.set_input_state(input_state)
+
+    samples = clifford.samples(1001, n_processes=2, seed=12)
+    assert len(samples) == 1001
+    assert samples == clifford.samples(1001, n_processes=2, seed=12)
+    assert samples != clifford.samples(1001, n_processes=2, seed=13)
+
+    slos = SLOSBackend()
+    slos.set_circuit(circuit)
+    slos.set_input_state(input_state)
+    count = 20000
+    counts = BSCount()
+    for state in clifford.samples(count, seed=5):
+        counts[state] += 1
+    for state, prob in slos.prob_distribution().items():
+        assert counts[state] / count == pytest.approx(prob, abs=0.015)
+
+
+def test_clifford_parallel_native_samplers():
+    circuit = Unitary(Matrix.random_unitary(4))
+    slos = SLOSBackend()
+    slos.set_circuit(circuit)
+    clifford = Clifford2017Backend()
+    clifford.set_circuit(circuit)
+    count = 20000
+    # Unseeded parallel runs use native samplers in the workers, for each group of indistinguishable photons
+    for input_state in [BasicState([1, 0, 2, 1]), BasicState("|{_:0},{_:1},{_:0},0>")]:
+        clifford.set_input_state(input_state)
+        samples = clifford.samples(count, n_processes=2)
+        assert len(samples) == count
+        expected = BSDistribution()
+        for group in input_state.separate_state():
+            slos.set_input_state(group)
+            expected = BSDistribution.tensor_product(expected, slos.prob_distribution(), merge_modes=True)
+        for state, prob in expected.items():
+            assert samples.count(state) / count == pytest.approx(prob, abs=0.015)
+
+
+def test_sampling_adapter():
+    circuit = Unitary(Matrix.random_unitary(5))
+    input_state = BasicState([1, 0, 2, 0, 1])
+    adapter = SamplingAdapter("SLOS")
+    adapter.set_circuit(circuit)
+    adapter.set_input_state(input_state)
+    count = 50000
+    counts = BSCount()
+    for state in adapter.samples(count):
+        counts[state] += 1
+    assert adapter.sample().n == 4
+
+    slos = SLOSBackend()
+    slos.set_circuit(circuit)
+    slos.set_input_state(input_state)
+    for state, prob in slos.prob_distribution().items():
+        assert counts[state] / count == pytest.approx(prob, abs=0.01)
+
+    adapter.set_input_state(BasicState([1, 1, 0, 0, 0]))
+    adapter.sample()
+    assert len(adapter._tables) == 2
+    # Each state is accounted with its occupations, and each table with its threshold and alias arrays
+    state_count = sum(len(states) for states, _, _ in [adapter._tables.get((1, 0, 2, 0, 1)), adapter._table()])
+    assert adapter._tables.size == state_count * (8 + 8 * 5 + 8 + 8)
+    adapter.set_circuit(Unitary(Matrix(circuit.compute_unitary())))  # Same unitary: output distributions are kept
+    assert len(adapter._tables) == 2
+    adapter.set_circuit(Unitary(Matrix.random_unitary(5)))
+    assert len(adapter._tables) == 0
+
+
 def check_output_distribution(backend: AProbAmpliBackend, input_state: BasicState, expected: dict):
     backend.set_input_state(input_state)
     prob_list = []
@@ -89,6 +204,25 @@ def test_backend_factory_default():
                               {BasicState("|1,0>"): 0.5, BasicState("|0,1>"): 0.5})
 
 
+def test_backend_factory_estimate():
+    circuit = Unitary(Matrix.random_unitary(16))
+    input_state = BasicState([1] * 8 + [0] * 8)
+    estimates = BackendFactory.estimate(circuit, input_state)
+    assert set(estimates) == {"SLOS", "Naive", "MPS"}
+    for estimate in estimates.values():
+        assert estimate["time"] > 0 and estimate["memory"] > 0
+    assert estimates["SLOS"]["time"] < estimates["Naive"]["time"]
+
+    few_outputs = [input_state, BasicState([0] * 8 + [1] * 8)]
+    assert BackendFactory.estimate(circuit, input_state, few_outputs)["Naive"]["time"] < estimates["Naive"]["time"]
+    assert BackendFactory.choose(circuit, input_state) == "SLOS"
+    assert BackendFactory.choose(circuit, input_state, few_outputs) == "Naive"
+    assert isinstance(BackendFactory.get_backend("auto", circuit=circuit, input_state=input_state,
+                                                 outputs=few_outputs), NaiveBackend)
+    with pytest.warns(UserWarning):
+        assert isinstance(BackendFactory.get_backend("auto"), SLOSBackend)
+
+
 @pytest.mark.parametrize("backend_name", ["SLOS", "Naive", "MPS"])
 def test_backend_identity(backend_name):
     backend: AProbAmpliBackend = BackendFactory.get_backend(backend_name)
@@ -162,7 +296,7 @@ def test_slos_symbolic():
     assert str(slos.probability(BasicState([0, 1]))) == "1.0*sin(theta/2)**2"
 
 
-@pytest.mark.parametrize("backend_name", ["SLOS", "Naive"])  # MPS not working with >2-modes components
+@pytest.mark.parametrize("backend_name", ["SLOS", "Naive"])
 def test_backend_cnot(backend_name):
     backend: AProbAmpliBackend = BackendFactory.get_backend(backend_name)
     cnot = catalog["postprocessed cnot"].build_circuit()
@@ -257,3 +391,392 @@ def test_evolve_indistinguishable(backend_name):
     backend.set_input_state(BasicState([1, 1]))
     sv_out = backend.evolve()
     assert_sv_close(sv_out, math.sqrt(2)/2*StateVector([2, 0]) - math.sqrt(2)/2*StateVector([0, 2]))
+
+
+@pytest.mark.parametrize("backend", [SLOSBackend(), NaiveBackend(), NaiveBackend(n_threads=3)])
+def test_prob_amplitudes(backend):
+    backend.set_circuit(Unitary(Matrix.random_unitary(6)))
+    backend.set_input_state(BasicState([1, 0, 2, 0, 1, 0]))
+    outputs = [BasicState([0, 0, 0, 4, 0, 0]), BasicState([1, 1, 1, 1, 0, 0]), BasicState([1, 0, 0, 0, 0, 0]),
+               BasicState([2, 0, 0, 0, 1, 1])]
+    amplitudes = backend.prob_amplitudes(outputs)
+    assert amplitudes.shape == (4,)
+    assert amplitudes[2] == 0
+    for output_state, amplitude in zip(outputs, amplitudes):
+        assert amplitude == pytest.approx(backend.prob_amplitude(output_state))
+
+
+def test_naive_bunched_states():
+    circuit = Unitary(Matrix.random_unitary(6))
+    input_state = BasicState([3, 3, 3, 3, 3, 0])
+    outputs = [BasicState([3, 3, 0, 3, 3, 3]), BasicState([5, 0, 5, 0, 5, 0]), BasicState([1, 2, 3, 4, 5, 0])]
+    slos = SLOSBackend()
+    naive = NaiveBackend()
+    for backend in (slos, naive):
+        backend.set_circuit(circuit)
+        backend.set_input_state(input_state)
+    for output_state in outputs:
+        assert naive.prob_amplitude(output_state) == pytest.approx(slos.prob_amplitude(output_state))
+
+
+def test_mps_truncation_error():
+    rng = np.random.default_rng(3)
+    circuit = GenericInterferometer(8, lambda i: BS(theta=rng.random() * 3) // PS(rng.random() * 6))
+    input_state = BasicState([1, 1, 1, 1, 0, 0, 0, 0])
+    slos = SLOSBackend()
+    slos.set_circuit(circuit)
+    slos.set_input_state(input_state)
+    expected = slos.prob_distribution()
+
+    errors = []
+    for max_error in [1e-12, 1e-4, 1e-1]:
+        mps = MPSBackend()
+        mps.set_max_truncation_error(max_error)
+        mps.set_circuit(circuit)
+        mps.set_input_state(input_state)
+        assert len(mps.bond_dimensions) == 7
+        errors.append(mps.truncation_error)
+        if max_error == 1e-12:
+            assert max(mps.bond_dimensions) > input_state.n + 1  # Bonds grow beyond the default cutoff
+            for state, prob in mps.prob_distribution().items():
+                assert prob == pytest.approx(expected[state], abs=1e-10)
+    assert errors[0] < 1e-10
+    assert errors == sorted(errors)
+    assert errors[-1] > 0
+
+
+def test_mps_batched_amplitudes():
+    rng = np.random.default_rng(5)
+    circuit = GenericInterferometer(6, lambda i: BS(theta=rng.random() * 3) // PS(rng.random() * 6))
+    input_state = BasicState([0, 1, 2, 0, 0, 0])
+    mps = MPSBackend()
+    mps.set_max_truncation_error(1e-14)
+    slos = SLOSBackend()
+    for backend in (mps, slos):
+        backend.set_circuit(circuit)
+        backend.set_input_state(input_state)
+
+    expected = slos.prob_distribution()
+    distribution = mps.prob_distribution()
+    assert len(distribution) == len(expected)
+    for state, prob in expected.items():
+        assert distribution[state] == pytest.approx(prob, abs=1e-10)
+
+    outputs = list(expected.keys())[::5] + [BasicState([1, 0, 0, 0, 0, 0])]
+    amplitudes = mps.prob_amplitudes(outputs)
+    assert amplitudes[-1] == 0
+    for output_state, amplitude in zip(outputs, amplitudes):
+        assert amplitude == pytest.approx(mps.prob_amplitude(output_state))
+
+
+def test_mps_wide_components():
+    mps = MPSBackend()
+    mps.set_max_truncation_error(1e-12)
+    mps.set_circuit(catalog["postprocessed cnot"].build_circuit())  # Contains PERM components on up to 5 modes
+    _assert_cnot(mps)
+
+    circuit = Circuit(7).add(0, BS()).add(1, Unitary(Matrix.random_unitary(5))).add(3, PERM([3, 1, 0, 2]))
+    input_state = BasicState([1, 0, 1, 1, 0, 0, 1])
+    slos = SLOSBackend()
+    for backend in (mps, slos):
+        backend.set_circuit(circuit)
+        backend.set_input_state(input_state)
+    for state, prob in slos.prob_distribution().items():
+        assert mps.probability(state) == pytest.approx(prob, abs=1e-10)
+
+
+def test_mps_compile_cache():
+    rng = np.random.default_rng(7)
+    circuit = GenericInterferometer(5, lambda i: BS(theta=rng.random() * 3) // PS(rng.random() * 6))
+    inputs = [BasicState([1, 1, 0, 0, 0]), BasicState([0, 1, 0, 1, 1]), BasicState([2, 0, 0, 0, 1])]
+    mps = MPSBackend()
+    mps.set_circuit(circuit)
+    mps.compile(inputs)  # One pass over the circuit for all input states
+    assert len(mps.cache) == 3
+
+    reference = MPSBackend()
+    reference.set_circuit(circuit)
+    for input_state in inputs:
+        mps.set_input_state(input_state)
+        reference.set_input_state(input_state)
+        for output_state in [BasicState([1, 1, 0, 0, 0]), BasicState([0, 0, 1, 1, 0])]:
+            assert mps.prob_amplitude(output_state) == pytest.approx(reference.prob_amplitude(output_state))
+    assert len(mps.cache) == 3
+
+    # Compiling other input states leaves the current one untouched
+    expected = mps.probability(BasicState([1, 0, 1, 0, 0]))
+    mps.compile([BasicState([0, 0, 1, 1, 0])])
+    assert mps.probability(BasicState([1, 0, 1, 0, 0])) == pytest.approx(expected)
+    assert len(mps.cache) == 4
+
+    # Another circuit does not reuse the MPS of the first one, but switching back to it does
+    mps.set_circuit(Circuit(5).add(0, BS()).add(2, BS()))
+    mps.set_input_state(inputs[0])
+    assert len(mps.cache) == 5
+    mps.set_circuit(circuit)
+    mps.set_input_state(inputs[0])
+    assert len(mps.cache) == 5
+
+    bounded = MPSBackend(cache_size=mps.cache.size // 4)
+    bounded.set_circuit(circuit)
+    bounded.compile(inputs)
+    assert bounded.cache.size <= bounded.cache.max_size
+    assert len(bounded.cache) < 3
+
+
+def test_mps_transition_cache():
+    circuit = Circuit(4).add(0, BS()).add(2, BS()).add(1, BS.H()).add(0, BS())
+    input_state = BasicState([1, 1, 1, 0])
+    mps = MPSBackend()
+    mps.set_circuit(circuit)
+    mps.set_input_state(input_state)
+    expected = mps.prob_amplitude(BasicState([1, 0, 1, 1]))
+    assert len(mps.transition_cache) == 2  # BS() and BS.H(), for a single d
+    assert mps.transition_cache.size == 2 * 4 ** 4 * 16  # d^4 complex amplitudes per tensor
+
+    bounded = MPSBackend(transition_cache_size=4 ** 4 * 16)
+    bounded.set_circuit(circuit)
+    bounded.set_input_state(input_state)
+    assert bounded.prob_amplitude(BasicState([1, 0, 1, 1])) == pytest.approx(expected)
+    assert len(bounded.transition_cache) == 1
+    assert MPSBackend().transition_cache.size == 0  # Tensors are not shared between backends
+
+
+def test_mps_samples():
+    rng = np.random.default_rng(3)
+    circuit = GenericInterferometer(5, lambda i: BS(theta=rng.random() * 3) // PS(rng.random() * 6))
+    input_state = BasicState([1, 1, 0, 1, 0])
+    mps = MPSBackend()
+    mps.set_cutoff(10)
+    slos = SLOSBackend()
+    for backend in (mps, slos):
+        backend.set_circuit(circuit)
+        backend.set_input_state(input_state)
+
+    count = 50000
+    samples = mps.samples(count)
+    assert len(samples) == count
+    assert all(state.n == 3 and state.m == 5 for state in samples[:100])
+    frequencies = BSCount()
+    for state in samples:
+        frequencies[state] += 1
+    for state, prob in slos.prob_distribution().items():
+        assert frequencies[state] / count == pytest.approx(prob, abs=0.01)
+    assert mps.sample().n == 3
+
+
+@pytest.mark.parametrize("backend_name", ["SLOS", "Naive"])
+def test_threshold_prob_distribution(backend_name):
+    backend = BackendFactory.get_backend(backend_name)
+    backend.set_circuit(Unitary(Matrix.random_unitary(6)))
+    backend.set_input_state(BasicState([1, 1, 0, 2, 0, 0]))
+    expected = BSDistribution()
+    for state, prob in backend.prob_distribution().items():
+        expected.add(BasicState([min(count, 1) for count in state]), prob)
+
+    clicks = backend.threshold_prob_distribution()
+    assert len(clicks) == len(expected)
+    for state, prob in expected.items():
+        assert clicks[state] == pytest.approx(prob, abs=1e-12)
+
+
+def test_slos_threshold_prob_distribution_mask():
+    slos = SLOSBackend(mask=["1   "], n=2)
+    slos.set_circuit(Unitary(Matrix.random_unitary(4)))
+    slos.set_input_state(BasicState([1, 0, 1, 0]))
+    clicks = slos.threshold_prob_distribution()
+    assert sum(clicks.values()) == pytest.approx(sum(slos.prob_distribution().values()))
+    assert all(state[0] == 1 for state in clicks)  # The mask requires a photon in mode 0
+
+    symbolic = SLOSBackend(use_symbolic=True)
+    symbolic.set_circuit(BS())
+    symbolic.set_input_state(BasicState([1, 1]))
+    with pytest.raises(AssertionError):
+        symbolic.threshold_prob_distribution()
+
+
+@pytest.mark.parametrize("backend_name", ["SLOS", "Naive"])
+@pytest.mark.parametrize("modes", [[2], [5, 1], [0, 1, 2, 3, 4, 5]])
+def test_marginal_distribution(backend_name, modes):
+    backend = BackendFactory.get_backend(backend_name)
+    backend.set_circuit(Unitary(Matrix.random_unitary(7)))
+    backend.set_input_state(BasicState([1, 1, 0, 2, 0, 1, 0]))
+    expected = BSDistribution()
+    for state, prob in backend.prob_distribution().items():
+        expected.add(BasicState([state[mode] for mode in modes]), prob)
+
+    marginal = backend.marginal_distribution(modes)
+    assert sum(marginal.values()) == pytest.approx(1)
+    for state, prob in expected.items():
+        assert marginal[state] == pytest.approx(prob, abs=1e-12)
+
+
+def test_marginal_distribution_restricted_output():
+    circuit = Unitary(Matrix.random_unitary(4))
+    input_state = BasicState([1, 0, 1, 0])
+    masked = SLOSBackend(mask=["1   "], n=2)
+    mps = MPSBackend()
+    mps.set_cutoff(1)
+    for backend in [masked, mps]:
+        backend.set_circuit(circuit)
+        backend.set_input_state(input_state)
+        expected = BSDistribution()
+        for state, prob in backend.prob_distribution().items():
+            expected.add(BasicState([state[0], state[2]]), prob)
+        marginal = backend.marginal_distribution([0, 2])
+        assert sum(marginal.values()) == pytest.approx(sum(expected.values()))
+        for state, prob in marginal.items():
+            assert prob == pytest.approx(expected[state])
+    assert all(state[0] > 0 for state in masked.marginal_distribution([0]))  # The mask requires a photon in mode 0
+
+
+def test_slos_all_prob_batch():
+    m = 4
+    unitaries = [Matrix.random_unitary(m) for _ in range(3)]
+    input_state = BasicState([1, 0, 2, 0])
+    slos = SLOSBackend()
+    slos.set_circuit(Unitary(unitaries[0]))
+    batch_res = slos.all_prob_batch(input_state, np.stack([np.array(u) for u in unitaries]))
+    assert batch_res.shape == (3, 20)
+    for u, probs in zip(unitaries, batch_res):
+        slos.set_circuit(Unitary(u))
+        assert probs == pytest.approx(slos.all_prob(input_state))
+
+
+def test_slos_multithreaded_paths():
+    circuit = Unitary(Matrix.random_unitary(5))
+    input_states = [BasicState([1, 1, 0, 1, 0]), BasicState([0, 2, 0, 1, 1]), BasicState([1, 0, 0, 0, 1])]
+    slos = SLOSBackend()
+    slos_mt = SLOSBackend(n_threads=4)
+    for backend in (slos, slos_mt):
+        backend.set_circuit(circuit)
+        backend.preprocess(input_states)
+    for input_state in input_states:
+        assert slos_mt.all_prob(input_state) == pytest.approx(slos.all_prob(input_state))
+    circuit = Unitary(Matrix.random_unitary(5))
+    slos.set_circuit(circuit)
+    slos_mt.set_circuit(circuit)  # Recompute the already deployed paths in parallel
+    for input_state in input_states:
+        assert slos_mt.all_prob(input_state) == pytest.approx(slos.all_prob(input_state))
+
+
+def test_slos_low_memory():
+    circuit = Unitary(Matrix.random_unitary(6))
+    input_state = BasicState([1, 1, 0, 2, 0, 0])
+    slos = SLOSBackend()
+    slos_low_mem = SLOSBackend(low_memory=True)
+    for backend in (slos, slos_low_mem):
+        backend.set_circuit(circuit)
+        backend.set_input_state(input_state)
+    assert slos_low_mem.all_prob(input_state) == pytest.approx(slos.all_prob(input_state))
+    bsd = slos.prob_distribution()
+    for state, prob in slos_low_mem.prob_distribution().items():
+        assert prob == pytest.approx(bsd[state])
+    assert 0 < slos_low_mem.peak_memory < slos.peak_memory
+
+    input_state = BasicState([0, 1, 0, 0, 0, 1])
+    slos.set_input_state(input_state)
+    slos_low_mem.set_input_state(input_state)
+    assert slos_low_mem.probability(input_state) == pytest.approx(slos.probability(input_state))
+
+
+def test_slos_out_of_core(tmp_path):
+    circuit = Unitary(Matrix.random_unitary(6))
+    input_state = BasicState([1, 1, 1, 0, 1, 0])
+    slos = SLOSBackend()
+    slos.set_circuit(circuit)
+    expected = slos.all_prob(input_state)
+
+    slos_disk = SLOSBackend(disk_threshold=256, scratch_dir=str(tmp_path))
+    slos_disk.DISK_CHUNK_SIZE = 7
+    slos_disk.FSM_CHUNK_SIZE = 6 * 8
+    slos_disk.set_circuit(circuit)
+    probs = slos_disk.all_prob(input_state)
+    assert isinstance(probs, np.memmap)
+    assert probs == pytest.approx(expected)
+    # At most two layers below the threshold, and a chunk of 8 parent states of the Fock space map, are held in RAM
+    assert slos_disk.peak_memory <= 2 * 256 + 8 * 6 * _TABLE_ENTRY_SIZE
+    assert slos_disk.probability(BasicState([0, 0, 0, 0, 4, 0])) == \
+        pytest.approx(slos.probability(BasicState([0, 0, 0, 0, 4, 0])))
+
+    output_file = tmp_path / "probs.npy"
+    slos.all_prob(input_state, str(output_file))
+    assert np.load(output_file) == pytest.approx(expected)
+
+
+def test_slos_fs_distribution():
+    slos = SLOSBackend()
+    slos.set_circuit(BS.H())
+    slos.set_input_state(BasicState([1, 1]))
+    fsd = slos.fs_distribution()
+    assert isinstance(fsd, FSDistribution)
+    assert len(fsd) == 3
+    assert fsd.m == 2 and fsd.n == 2
+    assert fsd[BasicState([2, 0])] == pytest.approx(0.5)
+    assert fsd[BasicState([1, 1])] == pytest.approx(0)
+    assert fsd[BasicState([1, 0])] == 0  # Not in the Fock space
+    assert fsd.probabilities[fsd.index(BasicState([0, 2]))] == pytest.approx(0.5)
+    bsd = fsd.to_bsd()
+    assert isinstance(bsd, BSDistribution)
+    assert len(bsd) == 2  # Null probabilities are skipped
+    assert bsd[BasicState([0, 2])] == pytest.approx(0.5)
+    for sample in fsd.sample(10):
+        assert sample in bsd
+
+
+def test_slos_fock_states():
+    fsa = xq.FSArray(5, 3)
+    states = _fock_states(5, 3)
+    assert states.shape == (fsa.count(), 5)
+    for idx in [0, 1, 17, fsa.count() - 1]:
+        assert BasicState(states[idx].tolist()) == BasicState(fsa[idx])
+    assert np.array_equal(_fock_states(5, 3, 10, 20), states[10:20])
+    assert np.array_equal(fock_space_map_table(5, 3, 4, 9), fock_space_map_table(5, 3)[4:9])
+
+
+def test_slos_fsm_cache(tmp_path):
+    cache = FSMapCache(directory=str(tmp_path))
+    circuit = Unitary(Matrix.random_unitary(5))
+    input_state = BasicState([1, 0, 2, 0, 1])
+    slos = SLOSBackend()
+    slos.set_circuit(circuit)
+    expected = slos.all_prob(input_state)
+    for _ in range(2):  # First backend fills the cache, the second one loads the memory-mapped maps
+        slos_cached = SLOSBackend(fsm_cache=cache)
+        slos_cached.set_circuit(circuit)
+        assert slos_cached.all_prob(input_state) == pytest.approx(expected)
+    assert isinstance(slos_cached._fsm_tables[4], np.memmap)
+    assert cache.size > 0
+
+    cache.clear()
+    assert cache.size == 0
+
+
+def test_fsm_cache_eviction(tmp_path):
+    table = np.zeros((100, 10), dtype=np.int32)
+    cache = FSMapCache(max_size=int(2.5 * table.nbytes), directory=str(tmp_path))
+    cache.put(10, 1, None, table)
+    cache.put(10, 2, None, table)
+    assert cache.get(10, 1) is not None  # Table 1 is now the most recently used
+    cache.put(10, 3, None, table)
+    assert cache.size <= cache.max_size
+    assert cache.get(10, 2) is None
+    assert cache.get(10, 1) is not None
+    assert cache.get(10, 3) is not None
+
+
+@pytest.mark.parametrize("low_memory", [False, True])
+def test_slos_complex64(low_memory):
+    circuit = Unitary(Matrix.random_unitary(14))
+    input_state = BasicState([1, 0] * 7)
+    slos = SLOSBackend()
+    slos_sp = SLOSBackend(dtype=np.complex64, low_memory=low_memory)
+    for backend in (slos, slos_sp):
+        backend.set_circuit(circuit)
+        backend.set_input_state(input_state)
+    probs = slos_sp.all_prob(input_state)
+    assert probs.dtype == np.float32
+    assert probs == pytest.approx(slos.all_prob(input_state), abs=1e-6)
+    assert slos_sp.probability(input_state) == pytest.approx(slos.probability(input_state), abs=1e-6)
+    # Fock space maps are counted as well: the numpy kernel only builds them by chunks
+    assert slos_sp.peak_memory <= slos.peak_memory // 2
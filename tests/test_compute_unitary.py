@@ -27,6 +27,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import copy
+
 import perceval as pcvl
 import perceval.components.unitary_components as comp
 import numpy as np
@@ -62,3 +64,51 @@ def test_WP_unitary():
 def test_PR_unitary():
     wp = comp.PR(delta=0.37)
     _check_unitary(wp)
+
+
+def test_incremental_circuit_unitary():
+    phases = [pcvl.P(f"phi{i}") for i in range(6)]
+    circuit = pcvl.Circuit(4)
+    for i, phi in enumerate(phases):
+        circuit.add(i % 3, comp.BS()).add(i % 3 + 1, comp.PS(phi))
+    circuit.add(0, pcvl.Circuit(2) // comp.PS(phases[0]) // comp.BS.H())
+    for phi in phases:
+        phi.set_value(0.3)
+    circuit.compute_unitary()
+
+    def full_product():
+        u = np.eye(4, dtype=complex)
+        for r, c in circuit._components:
+            cu = np.eye(4, dtype=complex)
+            cu[r[0]:r[-1] + 1, r[0]:r[-1] + 1] = np.asarray(c.compute_unitary())
+            u = cu @ u
+        return u
+
+    for i, value in [(2, 1.1), (4, 0.2), (0, 2.5), (5, 0.7), (2, 0.4)]:
+        phases[i].set_value(value)
+        assert np.allclose(circuit.compute_unitary(), full_product())
+
+    circuit.add(1, comp.PS(0.5))  # A structural change is handled as well
+    assert np.allclose(circuit.compute_unitary(), full_product())
+
+
+def test_incremental_circuit_unitary_checkpoints():
+    phases = [pcvl.P(f"phi{i}") for i in range(40)]
+    circuit = pcvl.Circuit(6)
+    for i, phi in enumerate(phases):
+        circuit.add(i % 5, comp.BS()).add(i % 5, comp.PS(phi))
+    for phi in phases:
+        phi.set_value(0.1)
+    circuit.compute_unitary()
+    assert not circuit._unitary_cache._prefix and not circuit._unitary_cache._suffix  # Built by the first update
+    assert copy.deepcopy(circuit)._unitary_cache is None
+
+    for i, value in [(0, 1.3), (39, 0.5), (17, 2.2), (18, 0.9), (3, 0.4), (3, 1.7)]:
+        phases[i].set_value(value)
+        expected = pcvl.Circuit(6)
+        for j, phi in enumerate(phases):
+            expected.add(j % 5, comp.BS()).add(j % 5, comp.PS(float(phi)))
+        assert np.allclose(circuit.compute_unitary(), expected.compute_unitary())
+        checkpoints = len(circuit._unitary_cache._prefix) + len(circuit._unitary_cache._suffix)
+        assert checkpoints <= 2 * circuit._unitary_cache.MAX_CHECKPOINTS
+
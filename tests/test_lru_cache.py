@@ -0,0 +1,68 @@
+# MIT License
+#
+# Copyright (c) 2022 Quandela
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# As a special exception, the copyright holders of exqalibur library give you
+# permission to combine exqalibur with code included in the standard release of
+# Perceval under the MIT license (or modified versions of such code). You may
+# copy and distribute such a combined system following the terms of the MIT
+# license for both exqalibur and Perceval. This exception for the usage of
+# exqalibur is limited to the python bindings used by Perceval.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import numpy as np
+
+from perceval.utils import LRUCache
+
+
+def test_lru_cache_eviction():
+    cache = LRUCache(3000)
+    for i in range(3):
+        assert cache.put(i, np.zeros(100))  # 800 bytes each
+    assert len(cache) == 3 and cache.size == 2400
+
+    assert cache.get(0) is not None  # 0 becomes the most recently used entry
+    cache.put(3, np.zeros(100))
+    assert 1 not in cache
+    assert all(key in cache for key in (0, 2, 3))
+    assert cache.size == 2400
+
+    assert not cache.put(4, np.zeros(1000))  # Larger than the whole cache
+    assert 4 not in cache and len(cache) == 3
+    assert cache.get(4, "missing") == "missing"
+
+    cache.put(0, {"a": np.zeros(200), "b": [np.zeros(100)]})  # Replacing a value updates the cache size
+    assert cache.size == 2400
+    assert list(key for key in range(5) if key in cache) == [0]
+
+    cache.max_size = 2000
+    assert len(cache) == 0
+    cache.put(0, np.zeros(100))
+    assert cache.pop(0) is not None
+    assert cache.size == 0 and len(cache) == 0
+
+
+def test_lru_cache_custom_size():
+    cache = LRUCache(10, sizeof=len)
+    cache.put("a", "abcdef")
+    cache.put("b", "ghijk")
+    assert "a" not in cache and cache.size == 5
+    cache.clear()
+    assert len(cache) == 0 and cache.size == 0
@@ -27,11 +27,13 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import math
 import pytest
 
-from perceval.components import Circuit, Processor, BS, Source, catalog, UnavailableModeException, Port, PortLocation
-from perceval.utils import BasicState, StateVector, SVDistribution, Encoding
-from perceval.backends import Clifford2017Backend
+from perceval.components import Circuit, Processor, BS, PBS, WP, Source, catalog, UnavailableModeException, Port, \
+    PortLocation
+from perceval.utils import BasicState, BSDistribution, Parameter, StateVector, SVDistribution, Encoding
+from perceval.backends import BackendFactory, Clifford2017Backend
 
 
 def test_processor_input_generation_0():
@@ -112,6 +114,38 @@ def test_processor_probs():
     assert pytest.approx(probs['physical_perf']) == 1
 
 
+@pytest.mark.parametrize("backend_name", ["SLOS", "Naive"])
+def test_processor_threshold_probs(backend_name):
+    circuit = Circuit(4) // BS() // (2, BS()) // (1, BS())
+    p_threshold = Processor(backend_name, circuit)
+    p_threshold.with_input(BasicState([1, 1, 1, 0]))
+    p_threshold.min_detected_photons_filter(2)
+    p_threshold.thresholded_output(True)
+    probs = p_threshold.probs()
+
+    # Same computation, thresholding the number resolved distribution
+    p_pnr = Processor(backend_name, circuit)
+    p_pnr.with_input(BasicState([1, 1, 1, 0]))
+    p_pnr.min_detected_photons_filter(0)
+    expected = BSDistribution()
+    for state, prob in p_pnr.probs()['results'].items():
+        expected[BasicState([min(count, 1) for count in state])] += prob
+    physical_perf = sum(prob for state, prob in expected.items() if state.n >= 2)
+    assert probs['physical_perf'] == pytest.approx(physical_perf)
+    for state, prob in probs['results'].items():
+        assert prob == pytest.approx(expected[state] / physical_perf)
+
+
+def test_processor_threshold_polarized_circuit():
+    # Polarized circuits still go through the polarization simulator
+    p = Processor("SLOS", Circuit(2) // WP(0.25, 0.1) // PBS())
+    p.with_input(BasicState("|{P:H},{P:V}>"))
+    p.thresholded_output(True)
+    probs = p.probs()["results"]
+    assert len(probs) == 1
+    assert probs[BasicState([1, 1])] == pytest.approx(1)
+
+
 def test_processor_samples():
     proc = Processor(Clifford2017Backend(), BS())
 
@@ -126,6 +160,55 @@ def test_processor_samples():
     samples = proc.samples(500)
     assert samples["results"].count(BasicState([1, 1])) > 50
 
+    # Backends computing probabilities can also sample
+    for backend_name in ["MPS", "SLOS"]:
+        proc = Processor(backend_name, BS())
+        assert proc.available_commands == ["samples", "probs"]
+        proc.with_input(BasicState("|1,1>"))
+        samples = proc.samples(500)
+        assert samples["results"].count(BasicState([1, 1])) == 0
+        assert len(samples["results"]) == 500
+
+
+def test_processor_probs_after_samples():
+    # probs and samples share the same backend instance, which must always hold the current circuit
+    theta = Parameter("theta")
+    proc = Processor("SLOS", BS(theta=theta))
+    theta.set_value(0.3)
+    proc.with_input(BasicState([1, 1]))
+    proc.probs()
+    theta.set_value(1.2)
+    proc.samples(10)
+    theta.set_value(0.3)
+    proc.with_input(BasicState([1, 0]))
+    res = proc.probs()["results"]
+    assert res[BasicState([1, 0])] == pytest.approx(math.cos(0.15) ** 2)
+    assert res[BasicState([0, 1])] == pytest.approx(math.sin(0.15) ** 2)
+
+
+def test_processor_auto_backend():
+    circuit = Circuit(3).add(0, BS()).add(1, BS.H())
+    p = Processor("auto", circuit)
+    assert p.available_commands == ["samples", "probs"]
+    assert p.backend is None  # Not chosen until an input state is set
+    p.with_input(BasicState([1, 1, 0]))
+    expected = BackendFactory.choose(p.linear_circuit(), BasicState([1, 1, 0]))
+    assert p.backend.name == expected
+    backend = p.backend
+    assert p.backend is backend  # Chosen once for a given problem
+
+    reference = Processor("SLOS", circuit)
+    reference.with_input(BasicState([1, 1, 0]))
+    result = p.probs()["results"]
+    for state, prob in reference.probs()["results"].items():
+        assert result[state] == pytest.approx(prob)
+
+    p.with_input(BasicState([1, 1, 1]))
+    assert p.backend is not backend  # Chosen again for a new input
+    backend = p.backend
+    p.add(0, BS())
+    assert p.backend is not backend  # ... or a new circuit
+
 
 def test_processor_samples_max_shots():
     p = Processor(Clifford2017Backend(), 4)  # Identity circuit with perfect source
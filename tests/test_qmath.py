@@ -27,8 +27,12 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import exqalibur as xq
+import numpy as np
+import pytest
+
 from perceval import BasicState, StateVector, BSDistribution, SVDistribution
-from perceval.utils.qmath import exponentiation_by_squaring
+from perceval.utils.qmath import exponentiation_by_squaring, permanent_with_multiplicities
 from _test_utils import assert_sv_close, assert_svd_close
 
 
@@ -70,3 +74,17 @@ def test_exponentiation():
     assert_svd_close(svd, svd)
     assert_svd_close(svd**2, svd * svd)
     assert_svd_close(svd**5, svd * svd * svd * svd * svd)
+
+
+@pytest.mark.parametrize("row_multiplicities, col_multiplicities", [([1, 2, 1], [2, 2]),
+                                                                     ([3, 0, 2, 3], [2, 2, 2, 2]),
+                                                                     ([1, 1, 1, 1, 2], [3, 3, 0]),
+                                                                     ([0, 0], [0, 0])])
+def test_permanent_with_multiplicities(row_multiplicities, col_multiplicities):
+    rng = np.random.default_rng(12)
+    shape = (len(row_multiplicities), len(col_multiplicities))
+    matrix = rng.normal(size=shape) + 1j * rng.normal(size=shape)
+    repeated = np.repeat(np.repeat(matrix, row_multiplicities, axis=0), col_multiplicities, axis=1)
+    expected = xq.permanent_cx(repeated, n_threads=1) if repeated.size else 1
+    assert permanent_with_multiplicities(matrix, row_multiplicities, col_multiplicities, chunk_size=7) == \
+        pytest.approx(expected)
@@ -33,7 +33,7 @@ import pytest
 from perceval.backends import AProbAmpliBackend, SLOSBackend
 from perceval.simulators import Simulator
 from perceval.components import Circuit, BS, PS
-from perceval.utils import BasicState, BSDistribution, StateVector, SVDistribution, PostSelect
+from perceval.utils import BasicState, BSDistribution, FSDistribution, Parameter, StateVector, SVDistribution, PostSelect
 from _test_utils import assert_sv_close
 
 
@@ -68,19 +68,65 @@ def test_simulator_probs_mock():
     output_dist = simulator.probs(input_state)
     assert len(output_dist) == 1
     assert list(output_dist.keys())[0] == BasicState([0, 0, 3])
-    assert simulator.DEBUG_evolve_count == 1
+    assert simulator.stats.cache_misses == 1
 
     input_state = BasicState('|{_:1},{_:2},{_:3}>')
     output_dist = simulator.probs(input_state)
     assert len(output_dist) == 1
     assert list(output_dist.keys())[0] == BasicState([3, 0, 0])
-    assert simulator.DEBUG_evolve_count == 4
+    assert simulator.stats.cache_misses == 4
 
     input_state = BasicState('|{_:1}{_:2}{_:3},0,0>')
     output_dist = simulator.probs(input_state)
     assert len(output_dist) == 1
     assert list(output_dist.keys())[0] == BasicState([3, 0, 0])
-    assert simulator.DEBUG_evolve_count == 4
+    assert simulator.stats.cache_misses == 4
+    assert simulator.stats.cache_hits == 1
+
+
+def test_simulator_evolve_cache_size():
+    sim = Simulator(SLOSBackend())
+    sim.set_circuit(BS())
+    sim.probs(BasicState([1, 0]))
+    assert sim.stats.cache_misses == 1 and sim.stats.cache_evictions == 0
+
+    # Room for a single evolved state: the least recently used one is evicted
+    sim.cache_size = sim._cache.size
+    res = sim.probs(BasicState([0, 1]))
+    assert res[BasicState([1, 0])] == pytest.approx(0.5)
+    assert sim.stats.cache_misses == 2 and sim.stats.cache_evictions == 1
+    sim.probs(BasicState([0, 1]))
+    assert sim.stats.cache_hits == 1
+
+    # Results are still computed when the cache is too small to hold anything
+    sim.cache_size = 0
+    res = sim.probs(BasicState('|{_:0},{_:1}>'))
+    assert res[BasicState([1, 1])] == pytest.approx(0.5)
+    assert sim.stats.cache_misses == 4 and len(sim._cache) == 0
+
+    sim.stats.reset()
+    assert sim.stats.cache_misses == 0 and sim.stats.merge_count == 0
+
+
+def test_simulator_set_same_circuit():
+    phi = Parameter("phi")
+    circuit = Circuit(2).add(0, PS(phi)).add(0, BS())
+    phi.set_value(0.5)
+    sim = Simulator(SLOSBackend())
+    sim.set_circuit(circuit)
+    sim.probs(BasicState([1, 1]))
+    assert sim.stats.cache_misses == 1
+
+    # Same unitary: cached evolutions are kept
+    sim.set_circuit(circuit)
+    sim.set_circuit(Circuit(2).add(0, PS(0.5)).add(0, BS()))
+    sim.probs(BasicState([1, 1]))
+    assert sim.stats.cache_misses == 1 and sim.stats.cache_hits == 1
+
+    phi.set_value(0.6)
+    sim.set_circuit(circuit)
+    sim.probs(BasicState([1, 1]))
+    assert sim.stats.cache_misses == 2
 
 
 def test_simulator_probs_svd_indistinguishable():
@@ -99,6 +145,20 @@ def test_simulator_probs_svd_indistinguishable():
     assert res[BasicState("|1,1>")] == pytest.approx(0.1)
 
 
+def test_simulator_probs_svd_pure_input():
+    simulator = Simulator(SLOSBackend())
+    simulator.set_circuit(BS.H())
+    res = simulator.probs_svd(SVDistribution(BasicState([1, 1])))['results']
+    assert isinstance(res, BSDistribution)
+    assert len(res) == 2  # Null probability states are not part of the distribution
+    assert res[BasicState([2, 0])] == pytest.approx(0.5)
+    assert res[BasicState([0, 2])] == pytest.approx(0.5)
+
+    res = simulator.probs_svd(SVDistribution(BasicState([1, 1])), keep_array=True)['results']
+    assert isinstance(res, FSDistribution)
+    assert res[BasicState([2, 0])] == pytest.approx(0.5)
+
+
 def test_simulator_probs_svd_distinguishable():
     in_svd = SVDistribution({
         BasicState('|{_:0}{_:1},{_:0}>'): 1
@@ -146,6 +206,29 @@ def test_simulator_probs_distinguishable():
     assert res[BasicState("|0,3>")] == pytest.approx(0.288)
 
 
+def test_simulator_probs_fully_distinguishable():
+    circuit = Circuit(4).add(0, BS()).add(2, BS()).add(1, BS(BS.r_to_theta(1/3))).add(0, PS(0.5)).add(1, BS())
+    sim = Simulator(SLOSBackend())
+    sim.set_circuit(circuit)
+    in_state = BasicState('|{_:0},{_:1},{_:2}{_:2},{_:4}>')
+
+    expected = BSDistribution()
+    for state in in_state.separate_state():
+        expected = BSDistribution.tensor_product(expected, sim.probs(state), merge_modes=True)
+    sim.stats.reset()
+    res = sim.probs(in_state)
+    # Only the photon pair is merged with the distinguishable photons
+    assert sim.stats.merge_count == 1
+    assert len(res) == len(expected)
+    for state, probability in expected.items():
+        assert res[state] == pytest.approx(probability)
+
+    res = sim.probs_svd(SVDistribution({in_state: 1}))['results']
+    assert len(res) == len(expected)
+    for state, probability in expected.items():
+        assert res[state] == pytest.approx(probability)
+
+
 def test_simulator_probs_postselection():
     input_state = BasicState([1, 1, 1])
     ps = PostSelect("[2] < 2")  # At most 1 photon on mode #2
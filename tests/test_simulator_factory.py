@@ -34,6 +34,7 @@ from perceval.backends._naive import NaiveBackend
 from perceval.utils import BasicState
 
 import numpy as np
+import pytest
 
 
 def test_create_simulator_from_circuit():
@@ -43,6 +44,10 @@ def test_create_simulator_from_circuit():
     assert isinstance(simu._backend, SLOSBackend)  # Default backend is SLOS
     assert simu._backend._circuit == c
 
+    with pytest.warns(UserWarning):
+        simu = SimulatorFactory.build(c, "auto")
+    assert isinstance(simu._backend, SLOSBackend)  # No input state to estimate the cost: fall back on SLOS
+
     simu = SimulatorFactory.build(c, SLOSBackend())
     assert isinstance(simu, Simulator)
     assert isinstance(simu._backend, SLOSBackend)